@@ -1,8 +1,11 @@
+import time
+_t_start = time.perf_counter()
 import streamlit as st
 from ui_pages import (
     page_upload, page_persona_choice, page_predefined_personas,
-    page_custom_persona, page_feedback
+    page_custom_persona, page_feedback, page_history, page_analytics, page_metrics
 )
+from metrics import admin_enabled, record, current_session_id
 
 st.set_page_config(page_title="Urban Design Role Feedback", page_icon="🏙️", layout="wide")
 
@@ -11,11 +14,11 @@ defaults = {
     'page': 'upload',
     'uploaded_image': None,
     'project_description': "",
+    'project_location': None,
     'selected_persona': None,
     'custom_persona': None,
     'chat_history': [],
-    'persona_history': [],
-    'conversation_history': {},
+    'conversation_id': None,
 }
 for k, v in defaults.items():
     if k not in st.session_state:
@@ -29,6 +32,10 @@ def sidebar_nav():
         st.button("Predefined Roles", on_click=lambda: st.session_state.update(page='predefined_personas'), use_container_width=True)
         st.button("Custom Role", on_click=lambda: st.session_state.update(page='custom_persona'), use_container_width=True)
         st.button("Feedback", on_click=lambda: st.session_state.update(page='feedback'), use_container_width=True)
+        st.button("History", on_click=lambda: st.session_state.update(page='history'), use_container_width=True)
+        st.button("Analytics", on_click=lambda: st.session_state.update(page='analytics'), use_container_width=True)
+        if admin_enabled():
+            st.button("Metrics (admin)", on_click=lambda: st.session_state.update(page='metrics'), use_container_width=True)
 
 def main():
     sidebar_nav()
@@ -43,8 +50,19 @@ def main():
         page_custom_persona()
     elif page == 'feedback':
         page_feedback()
+    elif page == 'history':
+        page_history()
+    elif page == 'analytics':
+        page_analytics()
+    elif page == 'metrics' and admin_enabled():
+        page_metrics()
     else:
         st.error(f"Unknown page: {page}")
+    # script start -> end of the first run of each session (see startup_profile.py)
+    if not st.session_state.get('first_paint_recorded'):
+        st.session_state.first_paint_recorded = True
+        record({"ts": time.time(), "stage": "first_paint", "session": current_session_id(), "page": page,
+                "ms": round((time.perf_counter() - _t_start) * 1000, 3)})
 
 if __name__ == "__main__":
     main()
@@ -2,18 +2,20 @@ import os
 import streamlit as st
 import openai
 
-CURRENT_MODEL = "gpt-4o-mini"
-
 def get_openai_client():
     try:
         try:
             api_key = st.secrets.get("OPENAI_API_KEY", None)
+            base_url = st.secrets.get("OPENAI_BASE_URL", None)
         except Exception:
-            api_key = os.getenv("OPENAI_API_KEY")
+            api_key, base_url = None, None
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        # OPENAI_BASE_URL points the app at a local stand-in (see standin.py)
+        base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
         if not api_key:
             st.error("OpenAI API key not found. Put it in .streamlit/secrets.toml or environment.")
             return None
-        return openai.OpenAI(api_key=api_key)
+        return openai.OpenAI(api_key=api_key, base_url=base_url)
     except Exception as e:
         st.error(f"Error initializing OpenAI client: {e}")
         return None
@@ -0,0 +1,219 @@
+import argparse, json, os, re, time, zlib
+from collections import defaultdict
+
+import numpy as np
+
+from rag import FACTS_PATH, FACT_EMBS_PATH, search_text, parse_as_of, _facts_checksum, load_precomputed_embeddings
+
+# Near-duplicate compaction of the fact store (the same incident reported by several
+# sources, overlapping open-data extracts).
+#
+#   python compact.py --facts fact.json --dry-run
+#
+# Candidate pairs come from two LSH schemes, so nothing is compared all-against-all:
+#   - MinHash over word 3-grams of the search text, banded into NUM_BANDS buckets
+#   - random-hyperplane signatures of the fact embeddings (when a matching FACT_EMBS_PATH exists)
+# A candidate pair is merged when its estimated Jaccard similarity >= --jaccard or its
+# embedding cosine >= --cosine. Each cluster keeps one canonical fact (newest as_of, then
+# longest summary) carrying the merged tags and ids; the other facts' sources are listed
+# under its "source" (source["merged"]), so provenance stays in one field. Embedding rows of
+# the kept facts are written back so the compacted store does not need re-embedding.
+# Buckets above --max-bucket (shared boilerplate) are not expanded into pairs; they are
+# printed and counted in the report so a large duplicate group is never dropped silently.
+
+NUM_PERM = 128
+NUM_BANDS = 16           # 8 rows per band: ~50% candidate probability at Jaccard 0.7
+HYPERPLANE_BITS = 16
+HYPERPLANE_TABLES = 8
+MAX_BUCKET = 200         # larger buckets are reported instead of expanded into pairs
+_PRIME = np.uint64(4294967311)  # smallest prime > 2**32
+
+
+def _shingles(fact, n=3):
+    text = fact.get("_search_text") or search_text(fact)
+    text = text.replace(fact.get("id", ""), " ").lower()
+    words = re.findall(r"[a-z0-9äöüß]+", text)
+    if len(words) < n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def minhash_signatures(facts, num_perm=NUM_PERM, seed=1):
+    """(n, num_perm) uint64 MinHash signatures, one vectorised pass per fact."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**31, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2**31, size=num_perm, dtype=np.uint64)
+    sigs = np.empty((len(facts), num_perm), dtype=np.uint64)
+    for i, fact in enumerate(facts):
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in _shingles(fact)), dtype=np.uint64)
+        sigs[i] = ((np.outer(x, a) + b) % _PRIME).min(axis=0)
+    return sigs
+
+
+def _bucket_pairs(keys, pairs, skipped, label, max_bucket=MAX_BUCKET):
+    """Add index pairs that share a bucket key (keys: one hashable per row)."""
+    buckets = defaultdict(list)
+    for i, k in enumerate(keys):
+        buckets[k].append(i)
+    for members in buckets.values():
+        if len(members) > max_bucket:
+            # the same group usually fills a bucket in every band; keep it once
+            skipped.setdefault(tuple(members), []).append(label)
+        elif len(members) > 1:
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+
+
+def candidate_pairs(sigs, embs=None, bands=NUM_BANDS, seed=1, max_bucket=MAX_BUCKET, skipped=None):
+    pairs = set()
+    skipped = {} if skipped is None else skipped
+    rows = sigs.shape[1] // bands
+    for band in range(bands):
+        block = np.ascontiguousarray(sigs[:, band * rows:(band + 1) * rows])
+        _bucket_pairs([r.tobytes() for r in block], pairs, skipped, f"minhash band {band}", max_bucket)
+    if embs is not None:
+        rng = np.random.default_rng(seed)
+        weights = 1 << np.arange(HYPERPLANE_BITS, dtype=np.int64)
+        for table in range(HYPERPLANE_TABLES):
+            planes = rng.standard_normal((embs.shape[1], HYPERPLANE_BITS)).astype(np.float32)
+            codes = ((np.asarray(embs) @ planes) > 0).astype(np.int64) @ weights
+            _bucket_pairs(codes.tolist(), pairs, skipped, f"hyperplane table {table}", max_bucket)
+    return pairs
+
+
+class _DisjointSet:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+
+def find_clusters(facts, embs=None, jaccard=0.7, cosine=0.95, max_bucket=MAX_BUCKET, skipped=None):
+    """Lists of fact indices (size >= 2) judged to be near-duplicates."""
+    sigs = minhash_signatures(facts)
+    pairs = candidate_pairs(sigs, embs, max_bucket=max_bucket, skipped=skipped)
+    if embs is not None:
+        norms = np.linalg.norm(np.asarray(embs), axis=1) + 1e-9
+    ds = _DisjointSet(len(facts))
+    for i, j in pairs:
+        same = float(np.mean(sigs[i] == sigs[j])) >= jaccard
+        if not same and embs is not None:
+            same = float(np.dot(embs[i], embs[j]) / (norms[i] * norms[j])) >= cosine
+        if same:
+            ds.union(i, j)
+    groups = defaultdict(list)
+    for i in range(len(facts)):
+        groups[ds.find(i)].append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def _rank(fact):
+    t = parse_as_of((fact.get("time") or {}).get("as_of"))
+    return (-1e9 if np.isnan(t) else t, len(fact.get("summary", "")), "geo" in fact)
+
+
+def merge_cluster(facts, members):
+    """Canonical fact of a cluster with sources, tags and ids of the others folded in."""
+    members = sorted(members, key=lambda i: _rank(facts[i]), reverse=True)
+    canon = dict(facts[members[0]])
+    source = dict(canon.get("source") or {})
+    merged, tags = list(source.pop("merged", [])), []
+    for i in members:
+        other = dict(facts[i].get("source") or {})
+        for src in [other] + other.pop("merged", []):
+            if src and src != source and src not in merged:
+                merged.append(src)
+        for tag in facts[i].get("tags", []):
+            if tag.lower() not in {t.lower() for t in tags}:
+                tags.append(tag)
+    if merged:
+        source["merged"] = merged
+    canon["source"] = source
+    canon["tags"] = tags
+    canon["merged_ids"] = sorted(set(canon.get("merged_ids", [])) | {facts[i]["id"] for i in members[1:]})
+    return members[0], canon
+
+
+def compact(facts, embs=None, jaccard=0.7, cosine=0.95, max_bucket=MAX_BUCKET):
+    """(kept facts, kept row indices, report). Order of surviving facts is preserved."""
+    t0 = time.perf_counter()
+    skipped = {}
+    clusters = find_clusters(facts, embs, jaccard, cosine, max_bucket, skipped)
+    for members, labels in skipped.items():
+        print(f"  skipped a group of {len(members)} facts (> max bucket {max_bucket}) in {len(labels)} "
+              f"LSH bucket(s), e.g. {', '.join(facts[i].get('id', '?') for i in members[:3])}")
+    replace, drop = {}, set()
+    for members in clusters:
+        keep, canon = merge_cluster(facts, members)
+        replace[keep] = canon
+        drop.update(i for i in members if i != keep)
+    rows = [i for i in range(len(facts)) if i not in drop]
+    kept = [replace.get(i, facts[i]) for i in rows]
+    report = {
+        "facts_before": len(facts),
+        "facts_after": len(kept),
+        "clusters": len(clusters),
+        "removed": len(drop),
+        "reduction_pct": round(100.0 * len(drop) / max(len(facts), 1), 1),
+        "skipped_groups": len(skipped),
+        "skipped_group_max_size": max((len(m) for m in skipped), default=0),
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    if embs is not None:
+        report["embedding_bytes_saved"] = int(len(drop) * embs.shape[1] * 4)
+    return kept, np.asarray(rows, dtype=np.int64), report
+
+
+def compact_file(path=FACTS_PATH, embs_path=FACT_EMBS_PATH, model="text-embedding-3-small",
+                 jaccard=0.7, cosine=0.95, dry_run=False, max_bucket=MAX_BUCKET):
+    with open(path, "r", encoding="utf-8") as f:
+        facts = json.load(f)
+    for d in facts:
+        d.pop("_search_text", None)
+    embs = load_precomputed_embeddings(_facts_checksum(facts), model, embs_path)
+    kept, rows, report = compact(facts, embs, jaccard, cosine, max_bucket)
+    report["used_embeddings"] = embs is not None
+    if dry_run or not report["removed"]:
+        return report
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("[\n" + ",\n".join(json.dumps(d, ensure_ascii=False) for d in kept) + "\n]\n")
+    os.replace(tmp, path)
+    if embs is not None:
+        # keep embeddings aligned with the compacted store (same format as ingest.py)
+        dims = int(embs.shape[1])
+        np.asarray(embs[rows], dtype=np.float32).tofile(embs_path + ".tmp")
+        del embs
+        os.replace(embs_path + ".tmp", embs_path)
+        with open(embs_path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"checksum": _facts_checksum(kept), "model": model, "count": len(kept), "dims": dims}, f)
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge near-duplicate facts in the fact store.")
+    ap.add_argument("--facts", default=FACTS_PATH)
+    ap.add_argument("--embeddings", default=FACT_EMBS_PATH)
+    ap.add_argument("--jaccard", type=float, default=0.7, help="MinHash Jaccard threshold")
+    ap.add_argument("--cosine", type=float, default=0.95, help="embedding cosine threshold")
+    ap.add_argument("--max-bucket", type=int, default=MAX_BUCKET, help="largest LSH bucket expanded into pairs")
+    ap.add_argument("--dry-run", action="store_true", help="only report what would be merged")
+    args = ap.parse_args()
+    report = compact_file(args.facts, args.embeddings, jaccard=args.jaccard, cosine=args.cosine,
+                          dry_run=args.dry_run, max_bucket=args.max_bucket)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,89 @@
-from typing import Dict
-from PIL import Image
+import os, time
+from typing import Dict, List, Optional
 import streamlit as st
 
-from client import get_openai_client, CURRENT_MODEL
+from client import get_openai_client
 from prompts import VOICE_GUIDE
 from rag import load_facts, _facts_checksum, embed_facts, retrieve_facts
+from geo import DEFAULT_RADIUS_M
+from metrics import trace, record_usage, payload_bytes, current_session_id
+from routing import get_router, VISION_MODEL, CHAT_TIMEOUT_S
+from images import encoded_image
+from scheduler import get_scheduler, estimate_tokens, priority, INTERACTIVE, NORMAL
+from singleflight import get_singleflight, payload_key
+from feedback_schema import FEEDBACK_FORMAT, response_format
+from story_cache import get_story, put_story
+from shared_cache import cache_key, get_text, put_text
+
+# Seconds an identical chat payload is answered from the shared cache. Off by default:
+# a cached answer is replayed verbatim to every user asking the same role the same thing.
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "0"))
+
+
+def _create_chat(client, stage: str, **kwargs):
+    """
+    client.chat.completions.create de-duplicated against identical in-flight calls,
+    hedged when slower than the model's rolling p95, admitted through the process-wide
+    scheduler and wrapped in a trace span.
+    """
+    session = current_session_id()  # attempts run on router threads, outside the session
+
+    def _call(on_start):
+        with trace(stage, model=kwargs.get("model"), request_bytes=payload_bytes(kwargs.get("messages")),
+                   session=session) as rec:
+            on_start()  # admitted: the router's hedge clock starts here
+            t0 = time.perf_counter()
+            response = client.with_options(timeout=CHAT_TIMEOUT_S).chat.completions.create(**kwargs)
+            # upstream time only: scheduler queueing must not feed the router's p95
+            get_router().observe(kwargs.get("model"), stage, (time.perf_counter() - t0) * 1000)
+            record_usage(rec, response)
+            rec["response_bytes"] = payload_bytes(response.choices[0].message.content)
+        return response
+
+    tokens = estimate_tokens(kwargs.get("messages"), max_tokens=kwargs.get("max_tokens", 0))
+    model = kwargs.get("model")
+    # identical concurrent requests (same persona/project opened by several sessions) share one upstream call
+    return get_singleflight().do(
+        payload_key("chat", kwargs),
+        lambda: get_router().run(
+            lambda on_start: get_scheduler().run(lambda: _call(on_start), model=model, tokens=tokens, session=session),
+            model=model, stage=stage,
+        ),
+        stage=stage,
+    )
+
+
+def _cached_chat_text(client, stage: str, **kwargs) -> str:
+    """
+    Message content of a chat call, reused across sessions and worker processes for an
+    identical payload (same persona, project, image, facts and question) for RESPONSE_CACHE_TTL.
+    """
+    if RESPONSE_CACHE_TTL <= 0:
+        # disabled: don't serialise and hash the payload (base64 image included) for nothing
+        return _create_chat(client, stage, **kwargs).choices[0].message.content
+    key = cache_key("chat", kwargs)
+    cached = get_text("chat", key)
+    if cached is not None:
+        return cached
+    content = _create_chat(client, stage, **kwargs).choices[0].message.content
+    if content:
+        put_text(key, content, ttl=RESPONSE_CACHE_TTL)
+    return content
 
-def image_to_base64(image):
-    """Convert PIL Image to base64 string for OpenAI API"""
-    import base64
-    import io
-
-    if image.mode in ('RGBA', 'LA'):
-        background = Image.new('RGB', image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-        image = background
-
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='JPEG', quality=85)
-    img_byte_arr = img_byte_arr.getvalue()
-    return base64.b64encode(img_byte_arr).decode('utf-8')
 
+def get_openai_response(persona_info: Dict, project_description: str, uploaded_image=None, user_message: str = "") -> str:
+    """Generate AI response (model chosen by routing.py) with multimodal capabilities, handling both generated and custom personas."""
+    # follow-ups are interactive and jump ahead of initial feedback / background work
+    with priority(INTERACTIVE if user_message else NORMAL):
+        return _get_openai_response(persona_info, project_description, uploaded_image, user_message)
 
 
-def get_openai_response(persona_info: Dict, project_description: str, uploaded_image=None, user_message: str = "") -> str:
-    """Generate AI response using gpt-4o-mini with multimodal capabilities, handling both generated and custom personas."""
+def _get_openai_response(persona_info: Dict, project_description: str, uploaded_image=None, user_message: str = "") -> str:
     try:
         # --- Load facts and build (or reuse) the index WITHOUT passing a client to cached funcs ---
         facts = load_facts()
-        checksum = _facts_checksum(facts)
+        with trace("facts_checksum"):
+            checksum = _facts_checksum(facts)
 
         if ('facts_embs' not in st.session_state) or (st.session_state.get('facts_checksum') != checksum):
             with st.spinner("Indexing local facts..."):
@@ -38,43 +93,52 @@ def get_openai_response(persona_info: Dict, project_description: str, uploaded_i
         # Pull relevant facts for this request (use user_message for follow-ups)
         top_facts = retrieve_facts(
             facts, st.session_state.facts_embs,
-            persona_info, project_description, user_message or "", k=5
+            persona_info, project_description, user_message or "", k=5,
+            location=st.session_state.get("project_location"),
+            radius_m=st.session_state.get("project_radius_m", DEFAULT_RADIUS_M),
+            checksum=checksum,
         )
         # Save for UI use outside this function
         st.session_state["last_top_facts"] = top_facts
 
-        def _compact_fact(f):
-            when = f.get("time", {}).get("as_of", "")
-            return f"[{f['id']}] {f['title']} — {f['summary']} (as of {when})"
-
-        facts_block = "\n".join(_compact_fact(f) for f in top_facts)
-
         # --- OpenAI client (not passed into cached funcs) ---
         client = get_openai_client()
         if not client:
             return "❌ Could not connect to OpenAI. Please check your API key."
 
-        CURRENT_MODEL = "gpt-4o-mini"
-
-        # --- Normalize persona fields (handles both lowercase keys and custom persona form keys) ---
-        place = persona_info.get('place') or persona_info.get('Place') or "the local area"
-        age = persona_info.get('age') or persona_info.get('Age', 'adult')
-        gender = persona_info.get('gender') or persona_info.get('Gender', 'resident')
-        frequency = persona_info.get('frequency') or persona_info.get('Frequency of use') or persona_info.get('frequency_of_use', 'regular')
-        reasons = persona_info.get('reasons') or persona_info.get('Reason for visiting') or persona_info.get('reason_for_visiting', 'various reasons')
-        values = persona_info.get('values') or persona_info.get('Other values') or persona_info.get('other_values', 'community well-being')
-        mobility = persona_info.get('mobility') or persona_info.get('Mobility habits') or persona_info.get('mobility_habits', 'standard mobility')
-        accessibility = persona_info.get('accessibility') or persona_info.get('Accessibility needs') or persona_info.get('accessibility_needs', 'none specified')
-        story = persona_info.get('story') or persona_info.get('user_story') or ""
-
-        # Ensure lists are joined
-        if isinstance(reasons, list): reasons = ", ".join(reasons)
-        if isinstance(values, list): values = ", ".join(values)
-        if isinstance(mobility, list): mobility = ", ".join(mobility)
-        if isinstance(accessibility, list): accessibility = ", ".join(accessibility)
-
-        # Persona profile text
-        persona_text = f"""
+        image_b64 = encoded_image(uploaded_image) if uploaded_image else None
+        if user_message:
+            return request_followup(client, persona_info, project_description, top_facts, user_message, image_b64)
+        return request_initial_feedback(client, persona_info, project_description, top_facts, image_b64)
+
+    except Exception as e:
+        return f"❌ Error connecting to OpenAI: {str(e)}\n\nPlease check:\n1. Your API key is correct\n2. You have sufficient OpenAI credits\n3. Your internet connection is stable"
+
+
+def _compact_fact(f):
+    when = f.get("time", {}).get("as_of", "")
+    return f"[{f['id']}] {f['title']} — {f['summary']} (as of {when})"
+
+
+def persona_prompt_text(persona_info: Dict):
+    """(place, persona profile text) for the system prompts; handles both lowercase keys and custom persona form keys."""
+    place = persona_info.get('place') or persona_info.get('Place') or "the local area"
+    age = persona_info.get('age') or persona_info.get('Age', 'adult')
+    gender = persona_info.get('gender') or persona_info.get('Gender', 'resident')
+    frequency = persona_info.get('frequency') or persona_info.get('Frequency of use') or persona_info.get('frequency_of_use', 'regular')
+    reasons = persona_info.get('reasons') or persona_info.get('Reason for visiting') or persona_info.get('reason_for_visiting', 'various reasons')
+    values = persona_info.get('values') or persona_info.get('Other values') or persona_info.get('other_values', 'community well-being')
+    mobility = persona_info.get('mobility') or persona_info.get('Mobility habits') or persona_info.get('mobility_habits', 'standard mobility')
+    accessibility = persona_info.get('accessibility') or persona_info.get('Accessibility needs') or persona_info.get('accessibility_needs', 'none specified')
+    story = persona_info.get('story') or persona_info.get('user_story') or ""
+
+    # Ensure lists are joined
+    if isinstance(reasons, list): reasons = ", ".join(reasons)
+    if isinstance(values, list): values = ", ".join(values)
+    if isinstance(mobility, list): mobility = ", ".join(mobility)
+    if isinstance(accessibility, list): accessibility = ", ".join(accessibility)
+
+    persona_text = f"""
 - Age: {age}
 - Gender: {gender}
 - Lives in: {place}
@@ -85,12 +149,30 @@ def get_openai_response(persona_info: Dict, project_description: str, uploaded_i
 - Accessibility needs: {accessibility}
 - Background: {story}
 """
+    return place, persona_text
+
+
+def _project_message(project_description: str, image_b64: str = None) -> Dict:
+    """User message carrying the project description and, if given, the design image."""
+    if image_b64:
+        return {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": f"Project description: {project_description}"},
+                {"type": "image_url", "image_url": {
+                    "url": f"data:image/jpeg;base64,{image_b64}",
+                    "detail": "high"
+                }}
+            ]
+        }
+    return {"role": "user", "content": f"Project description: {project_description}"}
 
-        # ----------------------
-        # FOLLOW-UP CHAT BRANCH
-        # ----------------------
-        if user_message:
-            system_prompt = f"""
+
+def request_followup(client, persona_info: Dict, project_description: str, top_facts, user_message: str, image_b64: str = None) -> str:
+    """Follow-up chat turn in the persona's voice."""
+    place, persona_text = persona_prompt_text(persona_info)
+    facts_block = "\n".join(_compact_fact(f) for f in top_facts)
+    system_prompt = f"""
 You are a long-term resident with the following characteristics:
 {persona_text}
 
@@ -107,40 +189,25 @@ Respond in your persona's voice, referencing what you see in the image when rele
 {VOICE_GUIDE}
 """
 
-            messages = [{"role": "system", "content": system_prompt}]
-
-            # Add project description + image
-            if uploaded_image:
-                image = Image.open(uploaded_image)
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": f"Project description: {project_description}"},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_to_base64(image)}",
-                            "detail": "high"
-                        }}
-                    ]
-                })
-            else:
-                messages.append({"role": "user", "content": f"Project description: {project_description}"})
-
-            # Add follow-up question
-            messages.append({"role": "user", "content": user_message})
-
-            response = client.chat.completions.create(
-                model=CURRENT_MODEL,
-                messages=messages,
-                temperature=0.4,
-                max_tokens=500
-            )
-            return response.choices[0].message.content
-
-        # ----------------------
-        # INITIAL FEEDBACK BRANCH
-        # ----------------------
-        else:
-            system_prompt = f"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        _project_message(project_description, image_b64),
+        {"role": "user", "content": user_message},
+    ]
+    return _cached_chat_text(
+        client, "chat_followup",
+        model=get_router().choose_model(has_image=bool(image_b64), stage="chat_followup"),
+        messages=messages,
+        temperature=0.4,
+        max_tokens=500
+    )
+
+
+def request_initial_feedback(client, persona_info: Dict, project_description: str, top_facts, image_b64: str = None) -> str:
+    """Initial structured (JSON) feedback; no Streamlit state involved, so batch jobs can call it directly."""
+    place, persona_text = persona_prompt_text(persona_info)
+    facts_block = "\n".join(_compact_fact(f) for f in top_facts)
+    system_prompt = f"""
 You are a long-term resident of {place}, and you have lived there for several years.
 You have the following characteristics:
 {persona_text}
@@ -153,20 +220,11 @@ You will be provided with:
 Based on your persona, the project description, and the project image, provide honest, empathetic, and experience-based feedback.
 Carefully examine the image to identify and mention relevant urban furniture, seating, vegetation, paths, lighting, and other design details.
 Please return your feedback strictly in the following JSON format:
-{{
-  "Descriptive feedback": "",
-  "What's you like": "",
-  "What's you concern": "",
-  "Safety": 0.0,
-  "Comfort": 0.0,
-  "Accessibility": 0.0,
-  "Aesthetics": 0.0,
-  "Social Interaction": 0.0 
-}}
+{FEEDBACK_FORMAT}
 
 Guidance:
-- "Descriptive feedback" should reflect your own lived perspective using empathy map style: what you see, hear, think, and feel when experiencing the design.
-- "What's you like" and "What's you concern" should be concise, max 3 bullet points each. If none, write "None".
+- "descriptive_feedback" should reflect your own lived perspective using empathy map style: what you see, hear, think, and feel when experiencing the design.
+- "likes" and "concerns" should be concise, max 3 short points each. If none, return an empty list.
 - Scores: numeric between 0.0 and 5.0 based on your subjective evaluation.
 - Do not generate content outside the specified JSON format.
 
@@ -174,46 +232,79 @@ Use the following local facts when relevant (IDs shown for context):
 {facts_block}
 """
 
-            if uploaded_image:
-                image = Image.open(uploaded_image)
-                response = client.chat.completions.create(
-                    model=CURRENT_MODEL,
-                    response_format={"type": "json_object"}, 
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": f"Project description: {project_description}"},
-                                {"type": "image_url", "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_to_base64(image)}",
-                                    "detail": "high"
-                                }}
-                            ]
-                        }
-                    ],
-                    temperature=0.4,
-                    max_tokens=1000
-                )
-            else:
-                response = client.chat.completions.create(
-                    model=CURRENT_MODEL,
-                    response_format={"type": "json_object"},
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Project description: {project_description}"}
-                    ],
-                    temperature=0.4,
-                    max_tokens=1000
-                )
-
-            return response.choices[0].message.content
-
-    except Exception as e:
-        return f"❌ Error connecting to OpenAI: {str(e)}\n\nPlease check:\n1. Your API key is correct\n2. You have sufficient OpenAI credits\n3. Your internet connection is stable"
-
-
-
+    return _cached_chat_text(
+        client, "chat_initial",
+        model=VISION_MODEL,
+        response_format=response_format(),
+        messages=[
+            {"role": "system", "content": system_prompt},
+            _project_message(project_description, image_b64),
+        ],
+        temperature=0.4,
+        max_tokens=1000
+    )
+
+
+def story_profile(persona_data: Dict) -> Dict:
+    """Normalised persona profile used in the story prompt (and as the story cache key)."""
+    # --- Normalize incoming fields to handle both your form keys and internal keys ---
+    place = (persona_data.get('place')
+             or persona_data.get('Place')
+             or "")
+    age = (persona_data.get('age')
+           or persona_data.get('Age')
+           or "")
+    gender = (persona_data.get('gender')
+              or persona_data.get('Gender')
+              or "")
+    frequency = (persona_data.get('frequency')
+                 or persona_data.get('frequency_of_use')
+                 or persona_data.get('Frequency of use')
+                 or "")
+    reasons = (persona_data.get('reasons')
+               or persona_data.get('reason_for_visiting')
+               or persona_data.get('Reason for visiting')
+               or "")
+    mobility = (persona_data.get('mobility')
+                or persona_data.get('mobility_habits')
+                or persona_data.get('Mobility habits')
+                or "")
+    accessibility = (persona_data.get('accessibility')
+                     or persona_data.get('accessibility_needs')
+                     or persona_data.get('Accessibility needs')
+                     or "")
+    values = (persona_data.get('values')
+              or persona_data.get('other_values')
+              or persona_data.get('Other values')
+              or "")
+
+    # Lists → readable strings
+    def _to_str(v):
+        if isinstance(v, list):
+            return ", ".join(str(x) for x in v if str(x).strip())
+        return str(v)
+
+    persona_json_obj = {
+        "Place": _to_str(place),
+        "Age": _to_str(age),
+        "Gender": _to_str(gender),
+        "Frequency of use": _to_str(frequency),
+        "Reason for visiting": _to_str(reasons),
+        "Mobility habits": _to_str(mobility),
+        "Accessibility needs": _to_str(accessibility),
+        "Other values": _to_str(values),
+    }
+    return persona_json_obj
+
+
+_STORY_GUIDANCE = (
+    "Your goal is to generate a vivid, empathetic, first-person narrative that reflects this person's relationship with their local urban environment (e.g., park, street, square, playground).\n"
+    "Use a natural human tone. Include contextual details (e.g., time of day, companions, what they see/do/feel/remember). "
+    "Keep it grounded and believable, focused on needs and values related to the space.\n"
+)
+
+# Generation settings are part of the story cache key; bump "prompt_version" when the prompt changes
+STORY_SETTINGS = {"model": "gpt-4o-mini", "temperature": 0.4, "max_tokens": 200, "prompt_version": 1}
 
 
 def generate_user_story(persona_data: Dict) -> str:
@@ -225,67 +316,24 @@ def generate_user_story(persona_data: Dict) -> str:
     import json
 
     try:
+        persona_json_obj = story_profile(persona_data)
+
+        # Identical profile + settings -> reuse the stored story
+        cached = get_story(persona_json_obj, STORY_SETTINGS)
+        if cached:
+            return cached
+
         client = get_openai_client()
         if not client:
             return "❌ Could not connect to OpenAI. Please check your API key."
 
-        # --- Normalize incoming fields to handle both your form keys and internal keys ---
-        place = (persona_data.get('place')
-                 or persona_data.get('Place')
-                 or "")
-        age = (persona_data.get('age')
-               or persona_data.get('Age')
-               or "")
-        gender = (persona_data.get('gender')
-                  or persona_data.get('Gender')
-                  or "")
-        frequency = (persona_data.get('frequency')
-                     or persona_data.get('frequency_of_use')
-                     or persona_data.get('Frequency of use')
-                     or "")
-        reasons = (persona_data.get('reasons')
-                   or persona_data.get('reason_for_visiting')
-                   or persona_data.get('Reason for visiting')
-                   or "")
-        mobility = (persona_data.get('mobility')
-                    or persona_data.get('mobility_habits')
-                    or persona_data.get('Mobility habits')
-                    or "")
-        accessibility = (persona_data.get('accessibility')
-                         or persona_data.get('accessibility_needs')
-                         or persona_data.get('Accessibility needs')
-                         or "")
-        values = (persona_data.get('values')
-                  or persona_data.get('other_values')
-                  or persona_data.get('Other values')
-                  or "")
-
-        # Lists → readable strings
-        def _to_str(v):
-            if isinstance(v, list):
-                return ", ".join(str(x) for x in v if str(x).strip())
-            return str(v)
-
-        persona_json_obj = {
-            "Place": _to_str(place),
-            "Age": _to_str(age),
-            "Gender": _to_str(gender),
-            "Frequency of use": _to_str(frequency),
-            "Reason for visiting": _to_str(reasons),
-            "Mobility habits": _to_str(mobility),
-            "Accessibility needs": _to_str(accessibility),
-            "Other values": _to_str(values),
-        }
-
         # Build prompt safely: inject a single JSON blob
         persona_json_str = json.dumps(persona_json_obj, ensure_ascii=False, indent=2)
 
         prompt = (
             "You are a user story generator for urban design research.\n"
             "You will be provided with a custom persona profile filled in by a user.\n"
-            "Your goal is to generate a vivid, empathetic, first-person narrative that reflects this person's relationship with their local urban environment (e.g., park, street, square, playground).\n"
-            "Use a natural human tone. Include contextual details (e.g., time of day, companions, what they see/do/feel/remember). "
-            "Keep it grounded and believable, focused on needs and values related to the space.\n"
+            + _STORY_GUIDANCE +
             "---\n"
             "Persona Profile Input:\n"
             f"{persona_json_str}\n"
@@ -299,16 +347,20 @@ def generate_user_story(persona_data: Dict) -> str:
         )
 
         # Use a vision-capable, instruction-following model
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = _create_chat(
+            client, "user_story",
+            model=STORY_SETTINGS["model"],
             messages=[
                 {"role": "system", "content": "You are a helpful writing assistant."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.4,
-            max_tokens=200
+            temperature=STORY_SETTINGS["temperature"],
+            max_tokens=STORY_SETTINGS["max_tokens"]
         )
-        return response.choices[0].message.content
+        story = response.choices[0].message.content
+        if story:
+            put_story(persona_json_obj, STORY_SETTINGS, story)
+        return story
 
     except Exception as e:
         # Fallback demo story so your UI never blocks
@@ -321,3 +373,83 @@ def generate_user_story(persona_data: Dict) -> str:
             "I find myself drawn to this space because it represents more than just a physical location—it's where my daily life unfolds."
         )
 
+
+# Stories written several-per-call are cached separately from single-call ones
+BATCH_STORY_SETTINGS = {**STORY_SETTINGS, "mode": "batch"}
+STORY_BATCH_SIZE = 8
+
+_STORY_BATCH_SCHEMA = {
+    "name": "user_stories",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "stories": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"index": {"type": "integer"}, "story": {"type": "string"}},
+                    "required": ["index", "story"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["stories"],
+        "additionalProperties": False,
+    },
+}
+
+
+def generate_user_stories(personas: List[Dict], batch_size: int = STORY_BATCH_SIZE) -> List[Optional[str]]:
+    """
+    Stories for many personas, several per chat call. Cached stories (single or batch)
+    are reused; a persona whose story could not be generated gets None.
+    """
+    import json
+
+    profiles = [story_profile(p) for p in personas]
+    out = [get_story(p, STORY_SETTINGS) or get_story(p, BATCH_STORY_SETTINGS) for p in profiles]
+    missing = [i for i, s in enumerate(out) if not s]
+    if not missing:
+        return out
+
+    client = get_openai_client()
+    if not client:
+        return out
+
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        payload = json.dumps([{"index": n, **profiles[i]} for n, i in enumerate(chunk)], ensure_ascii=False, indent=2)
+        prompt = (
+            "You are a user story generator for urban design research.\n"
+            "You will be provided with a list of persona profiles, each with an index.\n"
+            + _STORY_GUIDANCE +
+            "Write one separate story per profile, in that person's own first-person voice.\n"
+            "---\n"
+            "Persona Profiles Input:\n"
+            f"{payload}\n"
+            "---\n"
+            "Each user story must be ≤150 words. Return every story with the index of its profile."
+        )
+        try:
+            response = _create_chat(
+                client, "user_story_batch",
+                model=BATCH_STORY_SETTINGS["model"],
+                response_format={"type": "json_schema", "json_schema": _STORY_BATCH_SCHEMA},
+                messages=[
+                    {"role": "system", "content": "You are a helpful writing assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=BATCH_STORY_SETTINGS["temperature"],
+                max_tokens=BATCH_STORY_SETTINGS["max_tokens"] * len(chunk) + 100
+            )
+            items = json.loads(response.choices[0].message.content)["stories"]
+        except Exception:
+            continue
+        for item in items:
+            n = item.get("index")
+            if isinstance(n, int) and 0 <= n < len(chunk) and str(item.get("story", "")).strip():
+                i = chunk[n]
+                out[i] = item["story"].strip()
+                put_story(profiles[i], BATCH_STORY_SETTINGS, out[i])
+    return out
@@ -0,0 +1,115 @@
+import os, json
+from typing import Dict, Iterable, List
+
+# Strict structured output for the initial feedback. The model is constrained to
+# FEEDBACK_JSON_SCHEMA, so a response is parsed with one json.loads and a type check
+# into a slotted FeedbackRecord instead of the tolerant multi-stage parser in ui_pages.
+
+# "strict" -> response_format json_schema (default); "json_object" -> legacy free-form JSON mode
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "strict")
+
+SCORE_FIELDS = ("safety", "comfort", "accessibility", "aesthetics", "social_interaction")
+
+# schema key -> key used by the UI (and by the original prompt)
+LEGACY_KEYS = {
+    "descriptive_feedback": "Descriptive feedback",
+    "likes": "What's you like",
+    "concerns": "What's you concern",
+    "safety": "Safety",
+    "comfort": "Comfort",
+    "accessibility": "Accessibility",
+    "aesthetics": "Aesthetics",
+    "social_interaction": "Social Interaction",
+}
+
+FEEDBACK_JSON_SCHEMA = {
+    "name": "persona_feedback",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "descriptive_feedback": {"type": "string"},
+            "likes": {"type": "array", "items": {"type": "string"}},
+            "concerns": {"type": "array", "items": {"type": "string"}},
+            **{k: {"type": "number"} for k in SCORE_FIELDS},
+        },
+        "required": list(LEGACY_KEYS),
+        "additionalProperties": False,
+    },
+}
+
+FEEDBACK_FORMAT = """{
+  "descriptive_feedback": "",
+  "likes": [""],
+  "concerns": [""],
+  "safety": 0.0,
+  "comfort": 0.0,
+  "accessibility": 0.0,
+  "aesthetics": 0.0,
+  "social_interaction": 0.0
+}"""
+
+
+def response_format() -> Dict:
+    if STRUCTURED_OUTPUT == "strict":
+        return {"type": "json_schema", "json_schema": FEEDBACK_JSON_SCHEMA}
+    return {"type": "json_object"}
+
+
+def _clamp(v) -> float:
+    return max(0.0, min(5.0, float(v)))
+
+
+class FeedbackRecord:
+    __slots__ = ("descriptive_feedback", "likes", "concerns") + SCORE_FIELDS
+
+    def __init__(self, descriptive_feedback: str, likes: List[str], concerns: List[str],
+                 safety: float, comfort: float, accessibility: float, aesthetics: float,
+                 social_interaction: float):
+        self.descriptive_feedback = descriptive_feedback
+        self.likes = likes
+        self.concerns = concerns
+        self.safety = safety
+        self.comfort = comfort
+        self.accessibility = accessibility
+        self.aesthetics = aesthetics
+        self.social_interaction = social_interaction
+
+    @classmethod
+    def parse(cls, text) -> "FeedbackRecord":
+        """Fast path for schema-conforming output. Raises ValueError on anything else."""
+        data = json.loads(text) if isinstance(text, (str, bytes)) else text
+        if not isinstance(data, dict):
+            raise ValueError("feedback is not a JSON object")
+        try:
+            desc = data["descriptive_feedback"]
+            likes = data["likes"]
+            concerns = data["concerns"]
+            scores = [data[k] for k in SCORE_FIELDS]
+        except KeyError as e:
+            raise ValueError(f"missing field {e}") from None
+        if not isinstance(desc, str) or not isinstance(likes, list) or not isinstance(concerns, list):
+            raise ValueError("wrong field types")
+        if not all(isinstance(s, (int, float)) and not isinstance(s, bool) for s in scores):
+            raise ValueError("scores must be numbers")
+        likes = [s.strip() for s in likes if isinstance(s, str) and s.strip() and s.strip().lower() != "none"]
+        concerns = [s.strip() for s in concerns if isinstance(s, str) and s.strip() and s.strip().lower() != "none"]
+        return cls(desc, likes, concerns, *(_clamp(s) for s in scores))
+
+    def scores(self) -> Dict[str, float]:
+        return {LEGACY_KEYS[k]: getattr(self, k) for k in SCORE_FIELDS}
+
+    def to_dict(self) -> Dict:
+        """Dict with the UI's keys, as returned by ui_pages.parse_json_feedback."""
+        return {LEGACY_KEYS[k]: getattr(self, k) for k in self.__slots__}
+
+
+def parse_many(texts: Iterable[str]) -> List:
+    """Parse a batch of schema-conforming responses; entries that don't validate become None."""
+    out = []
+    for t in texts:
+        try:
+            out.append(FeedbackRecord.parse(t))
+        except (ValueError, TypeError):
+            out.append(None)
+    return out
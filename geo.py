@@ -0,0 +1,109 @@
+import math, re
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Spatial candidate selection for fact retrieval. Facts carry coordinates ("geo":
+# {"lat", "lon"}); hand-written facts without them fall back to the centroid of the
+# area in their id (VIE-<AREA>-...). A uniform grid over projected coordinates answers
+# radius queries by visiting only the cells that overlap the query circle. NumPy is
+# imported on first index use so the upload page can read the constants without it.
+
+EARTH_RADIUS_M = 6_371_000.0
+DEFAULT_RADIUS_M = 750.0
+CELL_SIZE_M = 500.0
+
+# Area codes used in fact ids -> (lat, lon) of the area's reference point
+AREA_CENTROIDS = {
+    "FLR": (48.2566, 16.3995),  # Floridsdorf, Am Spitz / station
+    "PRT": (48.2186, 16.3918),  # Praterstern
+    "KAR": (48.2005, 16.3699),  # Karlsplatz
+    "RAT": (48.2108, 16.3573),  # Rathausplatz
+    "DNK": (48.2118, 16.3776),  # Donaukanal at Schwedenplatz
+}
+
+# Place names / postcodes people type -> area code (first match wins)
+PLACE_GAZETTEER = [
+    (r"flori[d]?sdorf|\b1210\b|\b21st\b|\bxxi\b|am spitz", "FLR"),
+    (r"karlsplatz|resselpark|karlskirche", "KAR"),
+    (r"praterstern|\bprater\b|leopoldstadt|\b1020\b", "PRT"),
+    (r"rathaus|\b1010\b", "RAT"),
+    (r"donaukanal|schwedenplatz", "DNK"),
+]
+
+
+def resolve_location(place: str) -> Optional[Tuple[float, float]]:
+    """(lat, lon) for a free-text place, via the gazetteer; None if unknown."""
+    if not place:
+        return None
+    p = place.lower()
+    for pattern, area in PLACE_GAZETTEER:
+        if re.search(pattern, p):
+            return AREA_CENTROIDS[area]
+    return None
+
+
+def fact_coordinates(fact: Dict) -> Optional[Tuple[float, float]]:
+    geo = fact.get("geo") or {}
+    if "lat" in geo and "lon" in geo:
+        return float(geo["lat"]), float(geo["lon"])
+    parts = str(fact.get("id", "")).upper().split("-")
+    if len(parts) > 1 and parts[1] in AREA_CENTROIDS:
+        return AREA_CENTROIDS[parts[1]]
+    return None
+
+
+class GeoIndex:
+    """Uniform grid over equirectangular-projected fact coordinates."""
+
+    def __init__(self, facts, cell_size_m: float = CELL_SIZE_M):
+        import numpy as np
+        coords = [fact_coordinates(f) for f in facts]
+        self.has_geo = np.array([c is not None for c in coords], dtype=bool)
+        self.lat = np.array([c[0] if c else np.nan for c in coords], dtype=np.float64)
+        self.lon = np.array([c[1] if c else np.nan for c in coords], dtype=np.float64)
+        self.ref_lat = float(np.nanmean(self.lat)) if self.has_geo.any() else 0.0
+        self.cell = float(cell_size_m)
+        self._cos = math.cos(math.radians(self.ref_lat))
+
+        idx = np.flatnonzero(self.has_geo)
+        x, y = self._project(self.lat[idx], self.lon[idx])
+        cx = np.floor(x / self.cell).astype(np.int64)
+        cy = np.floor(y / self.cell).astype(np.int64)
+        # group fact indices by cell: sort by (cx, cy) once, then slice
+        order = np.lexsort((cy, cx))
+        cx, cy, idx = cx[order], cy[order], idx[order]
+        self.cells = {}
+        if len(idx):
+            breaks = np.flatnonzero((np.diff(cx) != 0) | (np.diff(cy) != 0)) + 1
+            for start, end in zip(np.r_[0, breaks], np.r_[breaks, len(idx)]):
+                self.cells[(int(cx[start]), int(cy[start]))] = idx[start:end]
+
+    def _project(self, lat, lon):
+        import numpy as np
+        x = np.radians(lon) * EARTH_RADIUS_M * self._cos
+        y = np.radians(lat) * EARTH_RADIUS_M
+        return x, y
+
+    def query_radius(self, lat: float, lon: float, radius_m: float = DEFAULT_RADIUS_M) -> "np.ndarray":
+        """Indices of facts within `radius_m` of (lat, lon), nearest first."""
+        import numpy as np
+        qx, qy = self._project(np.float64(lat), np.float64(lon))
+        x0, x1 = int(math.floor((qx - radius_m) / self.cell)), int(math.floor((qx + radius_m) / self.cell))
+        y0, y1 = int(math.floor((qy - radius_m) / self.cell)), int(math.floor((qy + radius_m) / self.cell))
+        buckets = [self.cells[(cx, cy)] for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1) if (cx, cy) in self.cells]
+        if not buckets:
+            return np.zeros(0, dtype=np.int64)
+        cand = np.concatenate(buckets)
+        d = haversine_m(lat, lon, self.lat[cand], self.lon[cand])
+        keep = d <= radius_m
+        return cand[keep][np.argsort(d[keep], kind="stable")]
+
+
+def haversine_m(lat, lon, lats, lons):
+    import numpy as np
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
@@ -0,0 +1,191 @@
+import os, json, sqlite3, hashlib, threading, uuid
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+# Persistent conversation store. Conversations are indexed by project, persona and
+# start time; messages are append-only rows, so saving never copies a whole chat
+# and history survives restarts. One connection per thread, WAL for concurrent readers.
+
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    project_description TEXT NOT NULL DEFAULT '',
+    persona_name TEXT NOT NULL,
+    persona_json TEXT NOT NULL,
+    session TEXT,
+    started_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conv_project ON conversations(project, started_at);
+CREATE INDEX IF NOT EXISTS idx_conv_persona ON conversations(persona_name, started_at);
+CREATE INDEX IF NOT EXISTS idx_conv_started ON conversations(started_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_msg_conv ON messages(conversation_id, id);
+"""
+
+_local = threading.local()
+
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    path = path or HISTORY_DB
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        conns[path] = conn
+    return conn
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def project_key(project_description: str, image_digest: str = "") -> str:
+    """Stable key for a project (description + optional image content hash)."""
+    h = hashlib.sha256((project_description or "").strip().encode("utf-8"))
+    h.update((image_digest or "").encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def start_conversation(persona: Dict, project_description: str, project: str = None,
+                       session: str = None, db: str = None) -> str:
+    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+    cid = f"{persona.get('name', 'Persona')}-{ts}-{uuid.uuid4().hex[:6]}"
+    conn = _connect(db)
+    with conn:
+        conn.execute(
+            "INSERT INTO conversations (id, project, project_description, persona_name, persona_json, session, started_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (cid, project or project_key(project_description), project_description or "",
+             persona.get("name", "Persona"), json.dumps(persona, ensure_ascii=False, default=str),
+             session, _now()),
+        )
+    return cid
+
+
+def append_message(conversation_id: str, role: str, content: str, db: str = None) -> None:
+    conn = _connect(db)
+    with conn:
+        conn.execute(
+            "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            (conversation_id, role, str(content), _now()),
+        )
+
+
+def append_messages(conversation_id: str, messages: List[Dict], db: str = None) -> None:
+    conn = _connect(db)
+    now = _now()
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            [(conversation_id, m.get("role", ""), str(m.get("content", "")), now) for m in messages],
+        )
+
+
+def list_conversations(project: str = None, persona_name: str = None, limit: int = 20,
+                       offset: int = 0, db: str = None) -> List[Dict]:
+    """One page of conversation headers, newest first (no message bodies)."""
+    where, args = [], []
+    if project:
+        where.append("project = ?"); args.append(project)
+    if persona_name:
+        where.append("persona_name = ?"); args.append(persona_name)
+    sql = ("SELECT c.id, c.project, c.project_description, c.persona_name, c.started_at, "
+           "(SELECT COUNT(*) FROM messages m WHERE m.conversation_id = c.id) AS n_messages "
+           "FROM conversations c")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY c.started_at DESC, c.rowid DESC LIMIT ? OFFSET ?"
+    rows = _connect(db).execute(sql, args + [int(limit), int(offset)]).fetchall()
+    return [dict(r) for r in rows]
+
+
+def count_conversations(project: str = None, persona_name: str = None, db: str = None) -> int:
+    where, args = [], []
+    if project:
+        where.append("project = ?"); args.append(project)
+    if persona_name:
+        where.append("persona_name = ?"); args.append(persona_name)
+    sql = "SELECT COUNT(*) FROM conversations" + (" WHERE " + " AND ".join(where) if where else "")
+    return _connect(db).execute(sql, args).fetchone()[0]
+
+
+def get_conversation(conversation_id: str, db: str = None) -> Optional[Dict]:
+    row = _connect(db).execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+    if row is None:
+        return None
+    conv = dict(row)
+    conv["persona"] = json.loads(conv.pop("persona_json"))
+    return conv
+
+
+def iter_messages(conversation_id: str, batch: int = 200, db: str = None) -> Iterator[Dict]:
+    """Yield messages in order, fetching `batch` rows at a time (keyset pagination)."""
+    conn = _connect(db)
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, role, content, created_at FROM messages WHERE conversation_id = ? AND id > ? "
+            "ORDER BY id LIMIT ?",
+            (conversation_id, last, batch),
+        ).fetchall()
+        if not rows:
+            return
+        for r in rows:
+            yield dict(r)
+        last = rows[-1]["id"]
+
+
+def persona_label(persona: Dict) -> str:
+    if 'occupation' in persona:
+        return f"{persona['name']} ({persona['occupation']})"
+    if 'gender' in persona:
+        return f"{persona['name']} ({persona['age']}-year-old {persona['gender']})"
+    return persona.get('name', 'Persona')
+
+
+def iter_export(conversation_id: str, db: str = None) -> Iterator[str]:
+    """Plain-text export, one chunk per message, without materialising the whole conversation."""
+    conv = get_conversation(conversation_id, db=db)
+    if conv is None:
+        return
+    persona = conv["persona"]
+    yield "Urban Design Feedback Session\n"
+    yield f"Project: {conv['project_description']}\n"
+    yield f"Community Member: {persona_label(persona)}\n\n"
+    for m in iter_messages(conversation_id, db=db):
+        speaker = persona.get('name', 'Persona') if m['role'] == 'persona' else "You"
+        yield f"{speaker}: {m['content']}\n\n"
+
+
+def export_to(conversation_id: str, fp, db: str = None) -> int:
+    """Stream the export into a binary file object; returns bytes written."""
+    n = 0
+    for chunk in iter_export(conversation_id, db=db):
+        data = chunk.encode("utf-8")
+        fp.write(data)
+        n += len(data)
+    return n
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 3 and sys.argv[1] == "export":
+        export_to(sys.argv[2], sys.stdout.buffer)
+    else:
+        for c in list_conversations(limit=int(sys.argv[1]) if len(sys.argv) > 1 else 20):
+            print(f"{c['started_at']}\t{c['id']}\t{c['persona_name']}\t{c['n_messages']} msgs\t{c['project']}")
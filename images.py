@@ -0,0 +1,93 @@
+import io, base64, hashlib
+import streamlit as st
+
+from metrics import trace
+
+# Uploaded images are decoded, thumbnailed and base64-encoded once per upload,
+# keyed by a content hash, so reruns and chat turns don't redo the work. PIL is only
+# imported once an image is actually decoded.
+
+THUMBNAIL_SIDE = 1024
+
+
+def image_bytes(uploaded) -> bytes:
+    """Raw bytes of an UploadedFile / file-like / bytes object."""
+    if uploaded is None:
+        return b""
+    if isinstance(uploaded, (bytes, bytearray)):
+        return bytes(uploaded)
+    if hasattr(uploaded, "getvalue"):
+        return uploaded.getvalue()
+    pos = uploaded.tell()
+    uploaded.seek(0)
+    data = uploaded.read()
+    uploaded.seek(pos)
+    return data
+
+
+def image_digest(uploaded) -> str:
+    """Content hash of an upload, memoised on the upload object itself."""
+    digest = getattr(uploaded, "_content_digest", None)
+    if digest is None:
+        digest = hashlib.sha256(image_bytes(uploaded)).hexdigest()
+        try:
+            uploaded._content_digest = digest
+        except AttributeError:
+            pass
+    return digest
+
+
+def image_to_base64(image):
+    """Convert PIL Image to base64 string for OpenAI API"""
+    from PIL import Image
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        image = background
+
+    with trace("image_to_base64", width=image.size[0], height=image.size[1]) as rec:
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format='JPEG', quality=85)
+        img_byte_arr = img_byte_arr.getvalue()
+        encoded = base64.b64encode(img_byte_arr).decode('utf-8')
+        rec["response_bytes"] = len(encoded)
+    return encoded
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _decoded_image(digest, _data):
+    from PIL import Image  # deferred: only needed once an image is uploaded
+    img = Image.open(io.BytesIO(_data))
+    img.load()
+    return img
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _thumbnail_bytes(digest, max_side, _data):
+    img = _decoded_image(digest, _data).copy()
+    img.thumbnail((max_side, max_side))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _encoded_image(digest, _data):
+    return image_to_base64(_decoded_image(digest, _data))
+
+
+def load_image(uploaded):
+    """Decoded PIL image for an upload (shared, treat as read-only)."""
+    return _decoded_image(image_digest(uploaded), image_bytes(uploaded))
+
+
+def thumbnail(uploaded, max_side: int = THUMBNAIL_SIDE) -> bytes:
+    """JPEG bytes of a display-sized thumbnail, suitable for st.image."""
+    return _thumbnail_bytes(image_digest(uploaded), max_side, image_bytes(uploaded))
+
+
+def encoded_image(uploaded) -> str:
+    """Base64 JPEG of the full image for the OpenAI API."""
+    return _encoded_image(image_digest(uploaded), image_bytes(uploaded))
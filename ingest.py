@@ -0,0 +1,230 @@
+import argparse, csv, hashlib, json, os, re, time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from rag import FACTS_PATH, FACT_EMBS_PATH, EMBED_BATCH, search_text, _create_embeddings
+from client import get_openai_client
+from scheduler import priority, BACKGROUND
+
+# Build a fact store from open-data exports (CSV / GeoJSON / JSON) instead of hand-editing fact.json.
+#
+#   python ingest.py sources.json --out fact.json --merge --embed --compact
+#
+# sources.json lists one mapping per export:
+#   {"sources": [{
+#       "path": "data/baumkataster_21.csv",          # .csv, .geojson or .json (list of records)
+#       "area": "FLR", "type": "environment", "slug": "tree",
+#       "id_field": "OBJECTID",
+#       "title": "Street tree {GATTUNG_ART}",
+#       "summary": "{GATTUNG_ART}, planted {PFLANZJAHR}, at {OBJEKT_STRASSE}.",
+#       "as_of": "2024",  or  "as_of_field": "DATENSTAND",
+#       "tags": ["trees", "green"], "tag_fields": ["GATTUNG_ART"],
+#       "source": {"name": "Baumkataster Wien", "url": "https://..."},
+#       "filter": {"BEZIRK": "21"}, "lat_field": "LAT", "lon_field": "LON"
+#   }]}
+#
+# Files are parsed in a process pool; facts are de-duplicated (by id and by normalised
+# title+summary) and streamed into the output JSON array as workers finish. With --embed
+# the accepted facts are embedded in batches of EMBED_BATCH and written as a raw float32
+# matrix (FACT_EMBS_PATH) that rag.embed_facts memory-maps instead of re-embedding.
+# --compact then merges near-duplicates across sources (see compact.py).
+
+
+class _Blank(dict):
+    def __missing__(self, key):
+        return ""
+
+
+def _records(src):
+    path = src["path"]
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, "r", encoding=src.get("encoding", "utf-8-sig"), newline="") as f:
+            yield from csv.DictReader(f, delimiter=src.get("delimiter", ","))
+        return
+    with open(path, "r", encoding=src.get("encoding", "utf-8")) as f:
+        data = json.load(f)
+    if isinstance(data, dict) and data.get("type") == "FeatureCollection":
+        for feat in data.get("features", []):
+            rec = dict(feat.get("properties") or {})
+            geom = feat.get("geometry") or {}
+            if geom.get("type") == "Point" and len(geom.get("coordinates") or []) >= 2:
+                rec["_lon"], rec["_lat"] = geom["coordinates"][:2]
+            yield rec
+    elif isinstance(data, list):
+        yield from data
+    elif isinstance(data, dict):
+        # common open-data wrappers: {"records": [...]}, {"data": [...]}, {"result": {"records": [...]}}
+        for key in ("records", "data", "items"):
+            if isinstance(data.get(key), list):
+                yield from data[key]
+                return
+        if isinstance(data.get("result"), dict) and isinstance(data["result"].get("records"), list):
+            yield from data["result"]["records"]
+
+
+def _clean(s) -> str:
+    return re.sub(r"\s+", " ", str(s)).strip()
+
+
+def _to_fact(src, rec, n):
+    row = _Blank({k: _clean(v) for k, v in rec.items() if v is not None})
+    area = src.get("area", "VIE").upper()
+    typ = src.get("type", "info")
+    slug = src.get("slug") or re.sub(r"[^a-z0-9]+", "", os.path.splitext(os.path.basename(src["path"]))[0].lower())
+    raw_id = row.get(src.get("id_field", ""), "") or str(n)
+    fact = {
+        "id": f"VIE-{area}-{typ}-{slug}-{re.sub(r'[^A-Za-z0-9]+', '', raw_id)}",
+        "title": _clean(src["title"].format_map(row)),
+        "summary": _clean(src["summary"].format_map(row)),
+        "type": typ,
+        "time": {"as_of": row.get(src["as_of_field"], "") if src.get("as_of_field") else src.get("as_of", "")},
+        "source": dict(src.get("source", {})),
+        "tags": list(src.get("tags", [])) + [row[f].lower() for f in src.get("tag_fields", []) if row.get(f)],
+    }
+    lat = rec.get(src["lat_field"]) if src.get("lat_field") else rec.get("_lat")
+    lon = rec.get(src["lon_field"]) if src.get("lon_field") else rec.get("_lon")
+    try:
+        if lat not in (None, "") and lon not in (None, ""):
+            fact["geo"] = {"lat": float(lat), "lon": float(lon)}
+    except (TypeError, ValueError):
+        pass
+    return fact
+
+
+def parse_source(src):
+    """Worker: one export file -> list of facts (runs in a child process)."""
+    flt = src.get("filter") or {}
+    limit = src.get("limit")
+    out = []
+    for n, rec in enumerate(_records(src)):
+        if any(_clean(rec.get(k, "")) != str(v) for k, v in flt.items()):
+            continue
+        fact = _to_fact(src, rec, n)
+        if fact["title"] and fact["summary"]:
+            out.append(fact)
+            if limit and len(out) >= limit:
+                break
+    return src["path"], out
+
+
+def _content_key(fact) -> str:
+    text = (fact["title"] + "|" + fact["summary"]).lower()
+    return hashlib.sha1(re.sub(r"[^a-z0-9äöüß]+", " ", text).strip().encode("utf-8")).hexdigest()
+
+
+class _Embedder:
+    """Embeds accepted facts in batches and appends rows to a raw float32 file."""
+
+    def __init__(self, path, model):
+        self.path, self.model = path, model
+        self.client = get_openai_client()
+        if not self.client:
+            raise RuntimeError("OpenAI client not available for --embed")
+        self.pending, self.count, self.dims = [], 0, None
+        self.f = open(path + ".tmp", "wb")
+
+    def add(self, fact):
+        self.pending.append(search_text(fact))
+        if len(self.pending) >= EMBED_BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with priority(BACKGROUND):
+            resp = _create_embeddings(self.client, "ingest_embed", self.model, self.pending)
+        M = np.asarray([e.embedding for e in resp.data], dtype=np.float32)
+        self.dims = M.shape[1]
+        self.f.write(M.tobytes())
+        self.count += len(M)
+        self.pending = []
+
+    def close(self, checksum):
+        self.flush()
+        self.f.close()
+        if not self.count:
+            # nothing to memmap; embed_facts falls back to embedding at runtime
+            os.remove(self.path + ".tmp")
+            print("  no facts written, skipped the embeddings file")
+            return
+        os.replace(self.path + ".tmp", self.path)
+        with open(self.path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"checksum": checksum, "model": self.model, "count": self.count, "dims": self.dims}, f)
+
+
+def ingest(sources, out_path, merge=False, embed=False, workers=None, model="text-embedding-3-small"):
+    seen_ids, seen_content = set(), set()
+    stats = defaultdict(int)
+    checksum = hashlib.sha256()  # same scheme as rag._facts_checksum
+    embedder = _Embedder(FACT_EMBS_PATH, model) if embed else None
+    tmp = out_path + ".tmp"
+    first = True
+
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write("[\n")
+
+        def emit(fact):
+            nonlocal first
+            if fact["id"] in seen_ids:
+                stats["duplicate_id"] += 1
+                return
+            ck = _content_key(fact)
+            if ck in seen_content:
+                stats["duplicate_content"] += 1
+                return
+            seen_ids.add(fact["id"])
+            seen_content.add(ck)
+            out.write(("" if first else ",\n") + json.dumps(fact, ensure_ascii=False))
+            first = False
+            checksum.update((fact.get("id", "") + fact.get("title", "") + fact.get("summary", "")).encode("utf-8"))
+            stats["written"] += 1
+            if embedder:
+                embedder.add(fact)
+
+        if merge and os.path.exists(out_path):
+            with open(out_path, "r", encoding="utf-8") as f:
+                for fact in json.load(f):
+                    fact.pop("_search_text", None)
+                    emit(fact)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(parse_source, src) for src in sources]
+            for fut in as_completed(futures):
+                path, facts = fut.result()
+                stats["parsed"] += len(facts)
+                print(f"  {path}: {len(facts)} facts")
+                for fact in facts:
+                    emit(fact)
+        out.write("\n]\n")
+
+    os.replace(tmp, out_path)
+    if embedder:
+        embedder.close(checksum.hexdigest())
+    return dict(stats)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert open-data exports into the fact store.")
+    ap.add_argument("sources", help="JSON file with a 'sources' list of mappings")
+    ap.add_argument("--out", default=FACTS_PATH)
+    ap.add_argument("--merge", action="store_true", help="keep the facts already in --out")
+    ap.add_argument("--embed", action="store_true", help="embed the result and write FACT_EMBS_PATH")
+    ap.add_argument("--compact", action="store_true", help="merge near-duplicate facts afterwards (compact.py)")
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    with open(args.sources, "r", encoding="utf-8") as f:
+        sources = json.load(f)["sources"]
+    t0 = time.time()
+    stats = ingest(sources, args.out, merge=args.merge, embed=args.embed, workers=args.workers)
+    print(f"done in {time.time() - t0:.1f}s: {stats}")
+    if args.compact:
+        from compact import compact_file
+        print(f"compaction: {compact_file(args.out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse, io, json, os, random, resource, sys, tempfile, threading, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Load test: N simulated users walk the app flow concurrently against a local stand-in
+# (or a replay file, or the real API with --real):
+#
+#   upload          image digest, thumbnail and base64 encoding, project description
+#   persona_choice  a predefined role, or a custom one whose story is generated (--custom-share)
+#   feedback        fact retrieval + initial structured feedback, then --followups chat turns
+#
+#   python loadtest.py --users 50 --concurrency 20 --followups 2 --chat-latency lognormal:1500,0.4 --rpm 500
+#
+# The flow calls the same functions as ui_pages/feedback (minus Streamlit rendering) and
+# keeps each session's state in a dict shaped like st.session_state, so memory per session
+# is what those pages retain. Reports throughput, per-step and per-stage latency
+# percentiles (from metrics records), errors and memory.
+
+# keep load-test traffic out of the real metrics log and caches (read at import time)
+os.environ.setdefault("METRICS_PATH", "")
+_tmp = tempfile.mkdtemp(prefix="loadtest-")
+os.environ.setdefault("STORY_CACHE_DB", os.path.join(_tmp, "stories.db"))
+os.environ.setdefault("CACHE_DIR", os.path.join(_tmp, "cache"))
+
+import numpy as np
+from PIL import Image
+
+import standin
+
+PROJECT = ("Redesign of the square in front of Floridsdorf station: wider sidewalks, 40 new trees, "
+           "shaded seating, a protected bike lane and a water feature replacing two car lanes.")
+QUESTIONS = [
+    "How would this work for you at night?",
+    "What would you change about the seating?",
+    "Would you cycle here more often with the new lane?",
+    "Is the water feature a good idea for families?",
+]
+
+
+def _percentiles(vals):
+    if not vals:
+        return {}
+    a = np.asarray(vals, dtype=np.float64)
+    p = np.percentile(a, [50, 90, 95, 99])
+    return {"n": len(a), "p50_ms": round(p[0], 1), "p90_ms": round(p[1], 1), "p95_ms": round(p[2], 1),
+            "p99_ms": round(p[3], 1), "max_ms": round(float(a.max()), 1)}
+
+
+def _design_image(path=None) -> bytes:
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    buf = io.BytesIO()
+    Image.effect_noise((1600, 1000), 64).convert("RGB").save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+class _Upload(io.BytesIO):
+    """Stands in for Streamlit's UploadedFile."""
+    name = "design.jpg"
+
+
+def run_user(ctx, args, rng):
+    """One user's walk through the pages; returns (session_state, step timings, error)."""
+    from personas import PREDEFINED_PERSONAS, form_profile, persona_from_profile
+    from feedback import generate_user_story, request_initial_feedback, request_followup
+    from feedback_schema import FeedbackRecord
+    from images import thumbnail, encoded_image
+    from rag import retrieve_facts
+    from scheduler import priority, INTERACTIVE, NORMAL
+
+    state = {"page": "upload", "chat_history": [], "project_description": PROJECT}
+    steps = {}
+
+    def step(name, fn):
+        t0 = time.perf_counter()
+        out = fn()
+        steps.setdefault(name, []).append((time.perf_counter() - t0) * 1000)
+        time.sleep(rng.uniform(0, args.think))
+        return out
+
+    try:
+        def upload():
+            state["uploaded_image"] = _Upload(ctx["image"])
+            thumbnail(state["uploaded_image"])
+            return encoded_image(state["uploaded_image"])
+        image_b64 = step("upload", upload)
+
+        def choose():
+            state["page"] = "persona_choice"
+            if rng.random() < args.custom_share:
+                profile = form_profile("Floridsdorf", rng.randint(18, 85), rng.choice(["Woman", "Man"]),
+                                       "Weekly", ["Walking", "Public transit"], reasons="commuting")
+                state["custom_persona"] = profile
+                return persona_from_profile(profile, generate_user_story(profile))
+            return dict(PREDEFINED_PERSONAS[rng.choice(list(PREDEFINED_PERSONAS))], place="Floridsdorf")
+        persona = state["selected_persona"] = step("persona_choice", choose)
+
+        state["page"] = "feedback"
+        client = ctx["client"]
+
+        def initial():
+            with priority(NORMAL):
+                top = retrieve_facts(ctx["facts"], ctx["embs"], persona, PROJECT, "", k=5, checksum=ctx["checksum"])
+                state["last_top_facts"] = top
+                raw = request_initial_feedback(client, persona, PROJECT, top, image_b64)
+            state["chat_history"].append({"role": "persona", "content": raw})
+            return FeedbackRecord.parse(raw)
+        step("feedback", initial)
+
+        for _ in range(args.followups):
+            question = rng.choice(QUESTIONS)
+
+            def followup():
+                with priority(INTERACTIVE):
+                    top = retrieve_facts(ctx["facts"], ctx["embs"], persona, PROJECT, question, k=5,
+                                         checksum=ctx["checksum"])
+                    state["last_top_facts"] = top
+                    reply = request_followup(client, persona, PROJECT, top, question, image_b64)
+                state["chat_history"] += [{"role": "user", "content": question}, {"role": "persona", "content": reply}]
+            step("followup", followup)
+        return state, steps, None
+    except Exception as e:
+        return state, steps, f"{type(e).__name__}: {e}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulate concurrent users through upload -> persona -> feedback.")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--followups", type=int, default=2)
+    ap.add_argument("--custom-share", type=float, default=0.3, help="share of users creating a custom role")
+    ap.add_argument("--think", type=float, default=0.0, help="max think time between steps (s)")
+    ap.add_argument("--ramp", type=float, default=0.0, help="spread user starts over this many seconds")
+    ap.add_argument("--image", help="design image to upload (default: generated 1600x1000 JPEG)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--real", action="store_true", help="use the configured OpenAI endpoint instead of a stand-in")
+    ap.add_argument("--no-tracemalloc", action="store_true")
+    ap.add_argument("--out", help="write the JSON report here as well")
+    standin.add_arguments(ap)
+    args = ap.parse_args()
+
+    sin = None
+    if not args.real:
+        sin = standin.standin_from_args(args)
+        server, base_url = standin.serve_in_background(sin)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-local")
+
+    from client import get_openai_client
+    from rag import load_facts, _facts_checksum, embed_facts
+    from metrics import recent_records, summarize
+    from scheduler import get_scheduler
+    from singleflight import get_singleflight
+
+    ctx = {"client": get_openai_client(), "image": _design_image(args.image)}
+    if not ctx["client"]:
+        sys.exit("no OpenAI client (set OPENAI_API_KEY or drop --real)")
+    ctx["facts"] = load_facts()
+    ctx["checksum"] = _facts_checksum(ctx["facts"])
+    ctx["embs"] = embed_facts(ctx["facts"], _checksum=ctx["checksum"])
+
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+        base_mem = tracemalloc.get_traced_memory()[0]
+    t_start = time.time()
+    requests_before = sin.counts["requests"] if sin is not None else 0  # corpus embedding above
+
+    rng = random.Random(args.seed)
+    seeds = [rng.random() for _ in range(args.users)]
+    active, peak_active, lock = 0, 0, threading.Lock()
+
+    def user(i):
+        nonlocal active, peak_active
+        time.sleep(args.ramp * i / max(args.users, 1))
+        with lock:
+            active += 1
+            peak_active = max(peak_active, active)
+        t0 = time.perf_counter()
+        try:
+            state, steps, err = run_user(ctx, args, random.Random(seeds[i]))
+        finally:
+            with lock:
+                active -= 1
+        return state, steps, err, (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(user, range(args.users)))
+    wall = time.perf_counter() - t0
+
+    report = {"users": args.users, "concurrency": args.concurrency, "wall_s": round(wall, 2)}
+    if not args.no_tracemalloc:
+        # every session's state is still referenced by `results`
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report["memory"] = {
+            "retained_per_session_kb": round((current - base_mem) / max(args.users, 1) / 1024, 1),
+            "peak_per_active_session_kb": round((peak - base_mem) / max(peak_active, 1) / 1024, 1),
+        }
+    else:
+        report["memory"] = {}
+    report["memory"]["max_rss_growth_mb"] = round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0) / 1024, 1)
+
+    errors = [e for _, _, e, _ in results if e]
+    steps = {}
+    for _, s, _, _ in results:
+        for name, vals in s.items():
+            steps.setdefault(name, []).extend(vals)
+    # by timestamp: the recent-records deque is bounded, so positions shift once it wraps
+    records = [r for r in recent_records() if r.get("ts", 0) >= t_start]
+    # upstream calls only: scheduler_wait / *_hedge / *_shared records carry a model too
+    traced_calls = sum(1 for r in records if r.get("model") and ("prompt_tokens" in r or r.get("error"))
+                       and r["stage"] != "scheduler_wait" and not r["stage"].endswith(("_hedge", "_shared")))
+    # with a stand-in, count what the upstream actually received
+    api_calls = sin.counts["requests"] - requests_before if sin is not None else traced_calls
+    report.update({
+        "sessions_per_s": round((args.users - len(errors)) / wall, 3),
+        "api_calls": api_calls,
+        "traced_api_calls": traced_calls,
+        "api_calls_per_s": round(api_calls / wall, 2),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "session": _percentiles([ms for _, _, e, ms in results if not e]),
+        "steps": {name: _percentiles(vals) for name, vals in steps.items()},
+        "stages": [r for r in summarize(records) if r["calls"]],
+        "scheduler": get_scheduler().stats(),
+        "singleflight_shared": get_singleflight().shared,
+    })
+    if sin is not None:
+        report["standin"] = dict(sin.counts)
+        server.shutdown()
+
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
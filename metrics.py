@@ -0,0 +1,189 @@
+import os, json, time, uuid, threading
+from collections import deque, defaultdict
+from contextlib import contextmanager
+
+# Per-stage tracing for a feedback turn: wall time, token usage, payload bytes and errors.
+# Records are kept in a bounded in-process buffer (for the admin panel) and appended to a
+# size-rotated JSONL file so they survive restarts and can be summarised offline.
+
+METRICS_PATH = os.getenv("METRICS_PATH", "metrics.jsonl")
+METRICS_MAX_BYTES = int(os.getenv("METRICS_MAX_BYTES", str(5 * 1024 * 1024)))
+METRICS_BACKUPS = int(os.getenv("METRICS_BACKUPS", "3"))
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+}
+
+_RECENT = deque(maxlen=5000)
+_LOCK = threading.Lock()
+
+
+def current_session_id() -> str:
+    """Stable id for the current Streamlit session ("-" outside a script run)."""
+    try:
+        import streamlit as st
+        if "session_id" not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex[:12]
+        return st.session_state.session_id
+    except Exception:
+        return "-"
+
+
+def payload_bytes(obj) -> int:
+    """Approximate wire size of a request/response payload."""
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8"))
+    try:
+        return len(json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"))
+    except Exception:
+        return 0
+
+
+def estimate_cost(model, prompt_tokens=0, completion_tokens=0, cached_tokens=0) -> float:
+    price = MODEL_PRICES.get(model)
+    if not price:
+        return 0.0
+    p_in, p_cached, p_out = price
+    fresh = max(0, prompt_tokens - cached_tokens)
+    return (fresh * p_in + cached_tokens * p_cached + completion_tokens * p_out) / 1_000_000
+
+
+def record_usage(rec: dict, response) -> None:
+    """Copy token usage (incl. cached prompt tokens) from an OpenAI response onto a trace record."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+    rec["prompt_tokens"] = prompt
+    rec["completion_tokens"] = completion
+    rec["cached_tokens"] = cached
+    rec["cost_usd"] = estimate_cost(rec.get("model"), prompt, completion, cached)
+
+
+def _rotate():
+    if not os.path.exists(METRICS_PATH) or os.path.getsize(METRICS_PATH) < METRICS_MAX_BYTES:
+        return
+    for i in range(METRICS_BACKUPS - 1, 0, -1):
+        src = f"{METRICS_PATH}.{i}"
+        if os.path.exists(src):
+            os.replace(src, f"{METRICS_PATH}.{i + 1}")
+    os.replace(METRICS_PATH, f"{METRICS_PATH}.1")
+
+
+def record(rec: dict) -> None:
+    with _LOCK:
+        _RECENT.append(rec)
+        if not METRICS_PATH:
+            return
+        try:
+            _rotate()
+            with open(METRICS_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            pass
+
+
+@contextmanager
+def trace(stage: str, model: str = None, **fields):
+    """
+    Time a stage and record it. Yields the record so callers can attach
+    token usage (`record_usage`) or payload sizes before it is written.
+    """
+    rec = {"ts": time.time(), "stage": stage, "model": model, "session": current_session_id()}
+    rec.update(fields)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except Exception as e:
+        rec["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        rec["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        record(rec)
+
+
+def recent_records(session: str = None):
+    with _LOCK:
+        recs = list(_RECENT)
+    if session:
+        recs = [r for r in recs if r.get("session") == session]
+    return recs
+
+
+def load_records(path: str = None):
+    path = path or METRICS_PATH
+    out = []
+    for p in [f"{path}.{i}" for i in range(METRICS_BACKUPS, 0, -1)] + [path]:
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    continue
+    return out
+
+
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    idx = (len(sorted_vals) - 1) * q
+    lo = int(idx)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (idx - lo)
+
+
+def summarize(records, by=("stage", "model")):
+    """Aggregate records into one row per (stage, model) with count, errors, p50/p95 ms, tokens and cost."""
+    groups = defaultdict(list)
+    for r in records:
+        groups[tuple(r.get(k) or "-" for k in by)].append(r)
+    rows = []
+    for key, recs in sorted(groups.items()):
+        ms = sorted(float(r.get("ms", 0.0)) for r in recs)
+        row = dict(zip(by, key))
+        row.update({
+            "calls": len(recs),
+            "errors": sum(1 for r in recs if r.get("error")),
+            "p50_ms": round(_percentile(ms, 0.50), 1),
+            "p95_ms": round(_percentile(ms, 0.95), 1),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in recs),
+            "cached_tokens": sum(r.get("cached_tokens", 0) for r in recs),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in recs),
+            "bytes_out": sum(r.get("request_bytes", 0) for r in recs),
+            "bytes_in": sum(r.get("response_bytes", 0) for r in recs),
+            "cost_usd": round(sum(r.get("cost_usd", 0.0) for r in recs), 6),
+        })
+        rows.append(row)
+    return rows
+
+
+def admin_enabled() -> bool:
+    try:
+        import streamlit as st
+        flag = st.secrets.get("ADMIN_METRICS", None)
+    except Exception:
+        flag = None
+    if flag is None:
+        flag = os.getenv("ADMIN_METRICS", "")
+    return str(flag).lower() in ("1", "true", "yes", "on")
+
+
+if __name__ == "__main__":
+    import sys
+    rows = summarize(load_records(sys.argv[1] if len(sys.argv) > 1 else None))
+    cols = ["stage", "model", "calls", "errors", "p50_ms", "p95_ms", "prompt_tokens", "cached_tokens", "completion_tokens", "cost_usd"]
+    print("\t".join(cols))
+    for r in rows:
+        print("\t".join(str(r[c]) for c in cols))
@@ -79,3 +79,41 @@ PERSONA_CATEGORIES = {
     "Other values": "What matters most to them"
 }
 
+# Options offered by the custom persona form (also used to pre-generate common stories)
+GENDER_OPTIONS = ["Woman", "Man", "Non-binary", "Prefer not to say", "Other"]
+FREQUENCY_OPTIONS = ["Daily", "Several times a week", "Weekly", "Monthly", "Occasionally", "Rarely"]
+MOBILITY_OPTIONS = ["Walking", "Cycling", "Public transit", "Driving", "Wheelchair", "Mobility aid", "Other"]
+
+
+def form_profile(place, age, gender, frequency, mobility, reasons="", accessibility="", values=""):
+    """Same shape page_custom_persona passes to generate_user_story."""
+    return {
+        "place": place,
+        "age": age,
+        "gender": gender,
+        "frequency_of_use": frequency,
+        "reason_for_visiting": reasons,
+        "mobility_habits": list(mobility),
+        "accessibility_needs": accessibility,
+        "other_values": values,
+        "mobility": ", ".join(mobility),
+    }
+
+
+def persona_from_profile(persona_data, user_story):
+    """Persona dict for a custom (form-shaped) profile plus its generated story."""
+    return {
+        'name': f"{persona_data.get('age')}-year-old {persona_data.get('gender', 'Person')}",
+        'age': persona_data.get('age'),
+        'place': persona_data.get('place'),
+        'gender': persona_data.get('gender'),
+        'frequency': persona_data.get('frequency_of_use'),
+        'reasons': persona_data.get('reason_for_visiting'),
+        'mobility': persona_data.get('mobility', ''),
+        'accessibility': persona_data.get('accessibility_needs'),
+        'values': persona_data.get('other_values'),
+        'story': user_story,
+        'background': f"Regular user of {persona_data.get('place', 'the area')}, visits {persona_data.get('frequency_of_use', 'regularly')}",
+        'concerns': ['Community well-being', 'Accessibility', 'Safety'],
+        'tone': 'Personal and experience-based'
+    }
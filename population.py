@@ -0,0 +1,232 @@
+import argparse, json, os, random, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from personas import form_profile, persona_from_profile
+from feedback import generate_user_stories, request_initial_feedback
+from feedback_schema import FeedbackRecord, SCORE_FIELDS, LEGACY_KEYS
+from images import image_to_base64
+from rag import load_facts, _facts_checksum, embed_facts, retrieve_facts, fact_time_index
+from geo import GeoIndex
+from client import get_openai_client
+from scheduler import priority, BACKGROUND
+
+# Synthetic population mode: sample many custom personas from attribute distributions,
+# write their stories in batched calls, run the initial-feedback pipeline for each with
+# bounded concurrency and stream one JSON line per persona to disk.
+#
+#   python population.py --place Floridsdorf --project project.txt --image design.jpg --n 2000 --out runs/flr.jsonl
+#   python population.py --summarize runs/flr.jsonl
+#
+# Categorical attributes are {value: weight}; "mobility_habits" holds independent
+# inclusion probabilities (a persona can walk *and* take transit); "age" uses "lo-hi" brackets.
+
+DEFAULT_DISTRIBUTIONS = {
+    "age": {"18-29": 0.22, "30-44": 0.27, "45-64": 0.31, "65-90": 0.20},
+    "gender": {"Woman": 0.50, "Man": 0.48, "Non-binary": 0.02},
+    "frequency_of_use": {"Daily": 0.25, "Several times a week": 0.25, "Weekly": 0.20,
+                         "Monthly": 0.15, "Occasionally": 0.10, "Rarely": 0.05},
+    "mobility_habits": {"Walking": 0.85, "Public transit": 0.60, "Cycling": 0.30, "Driving": 0.25,
+                        "Mobility aid": 0.05, "Wheelchair": 0.02},
+    "accessibility_needs": {"": 0.70, "step-free paths and ramps": 0.10,
+                            "seating with back support at short intervals": 0.10,
+                            "good lighting and clear signage": 0.07, "audio signals at crossings": 0.03},
+    "reason_for_visiting": {"commuting": 0.30, "walking the dog": 0.15, "meeting friends": 0.20,
+                            "taking children to play": 0.15, "exercise": 0.10, "shopping and errands": 0.10},
+    "other_values": {"safety": 0.25, "greenery and shade": 0.20, "community connection": 0.20,
+                     "quiet and rest": 0.15, "affordability": 0.10, "cleanliness": 0.10},
+}
+
+CHUNK_SIZE = 64
+SCORE_LABELS = [LEGACY_KEYS[k] for k in SCORE_FIELDS]
+
+
+def load_distributions(path: str = None) -> Dict:
+    dist = {k: dict(v) for k, v in DEFAULT_DISTRIBUTIONS.items()}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            dist.update(json.load(f))
+    return dist
+
+
+def _choice(rng, weights: Dict):
+    values = list(weights)
+    return rng.choices(values, weights=[float(weights[v]) for v in values], k=1)[0]
+
+
+def sample_persona(rng, place: str, dist: Dict) -> Dict:
+    lo, hi = (int(x) for x in _choice(rng, dist["age"]).split("-"))
+    mob_p = dist["mobility_habits"]
+    mobility = [m for m, p in mob_p.items() if rng.random() < float(p)]
+    if not mobility:
+        mobility = [max(mob_p, key=lambda m: float(mob_p[m]))]
+    return form_profile(
+        place, rng.randint(lo, hi), _choice(rng, dist["gender"]), _choice(rng, dist["frequency_of_use"]),
+        mobility,
+        reasons=_choice(rng, dist["reason_for_visiting"]),
+        accessibility=_choice(rng, dist["accessibility_needs"]),
+        values=_choice(rng, dist["other_values"]),
+    )
+
+
+def sample_population(n: int, place: str, dist: Dict = None, seed: int = 0) -> List[Dict]:
+    """n form-shaped profiles with stable ids (same seed -> same population)."""
+    rng = random.Random(seed)
+    dist = dist or DEFAULT_DISTRIBUTIONS
+    out = []
+    for i in range(n):
+        p = sample_persona(rng, place, dist)
+        p["id"] = f"P{i:06d}"
+        out.append(p)
+    return out
+
+
+def _done_ids(path: str):
+    done = set()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                # failed rows are retried on the next run
+                if "id" in row and "error" not in row:
+                    done.add(row["id"])
+    return done
+
+
+def evaluate_population(profiles: List[Dict], project_description: str, out_path: str,
+                        image_b64: str = None, concurrency: int = 8, k: int = 5) -> int:
+    """
+    Run stories + initial feedback for every profile not already in `out_path`,
+    appending one JSON line per persona as soon as it finishes. Returns lines written.
+    """
+    facts = load_facts()
+    checksum = _facts_checksum(facts)
+    fact_embs = embed_facts(facts, _checksum=checksum)
+    geo_index, time_index = GeoIndex(facts), fact_time_index(facts, checksum)
+    client = get_openai_client()
+    if not client:
+        raise RuntimeError("OpenAI client not available")
+
+    done = _done_ids(out_path)
+    todo = [p for p in profiles if p["id"] not in done]
+    written = 0
+
+    def one(profile, story):
+        with priority(BACKGROUND):
+            persona = persona_from_profile(profile, story or "")
+            t0 = time.perf_counter()
+            row = {"id": profile["id"], "profile": profile, "story": story}
+            try:
+                top = retrieve_facts(facts, fact_embs, persona, project_description, "", k=k,
+                                     geo_index=geo_index, time_index=time_index, checksum=checksum)
+                raw = request_initial_feedback(client, persona, project_description, top, image_b64)
+                row["facts"] = [f.get("id") for f in top]
+                row["feedback"] = FeedbackRecord.parse(raw).to_dict()
+            except Exception as e:
+                row["error"] = f"{type(e).__name__}: {e}"
+            row["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            return row
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for start in range(0, len(todo), CHUNK_SIZE):
+            chunk = todo[start:start + CHUNK_SIZE]
+            with priority(BACKGROUND):
+                stories = generate_user_stories(chunk)
+            pending = set()
+            for profile, story in zip(chunk, stories):
+                # keep at most 2x concurrency futures alive
+                while len(pending) >= 2 * concurrency:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        out.write(json.dumps(fut.result(), ensure_ascii=False) + "\n")
+                        written += 1
+                    out.flush()
+                pending.add(pool.submit(one, profile, story))
+            for fut in wait(pending).done:
+                out.write(json.dumps(fut.result(), ensure_ascii=False) + "\n")
+                written += 1
+            out.flush()
+            print(f"  {start + len(chunk)}/{len(todo)} personas evaluated")
+    return written
+
+
+def score_matrix(path: str):
+    """(ids, profiles, scores[n, 5]) for every successful row of a results file."""
+    ids, profiles, rows = [], [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue
+            fb = r.get("feedback")
+            if not fb:
+                continue
+            rec_scores = [fb.get(label) for label in SCORE_LABELS]
+            if any(v is None for v in rec_scores):
+                continue
+            ids.append(r["id"])
+            profiles.append(r["profile"])
+            rows.append(rec_scores)
+    return ids, profiles, np.asarray(rows, dtype=np.float32).reshape(-1, len(SCORE_FIELDS))
+
+
+def summarize(path: str) -> Dict:
+    """Mean / std / p10 / p50 / p90 per score, overall and per age bracket."""
+    _, profiles, S = score_matrix(path)
+    def stats(M):
+        if not len(M):
+            return {}
+        q = np.percentile(M, [10, 50, 90], axis=0)
+        return {lab: {"mean": round(float(M[:, j].mean()), 3), "std": round(float(M[:, j].std()), 3),
+                      "p10": round(float(q[0, j]), 2), "p50": round(float(q[1, j]), 2), "p90": round(float(q[2, j]), 2)}
+                for j, lab in enumerate(SCORE_LABELS)}
+
+    ages = np.asarray([int(p.get("age") or 0) for p in profiles])
+    by_age = {}
+    for lo, hi in ((18, 29), (30, 44), (45, 64), (65, 120)):
+        sel = (ages >= lo) & (ages <= hi)
+        if sel.any():
+            by_age[f"{lo}-{hi}"] = {"n": int(sel.sum()), **stats(S[sel])}
+    return {"n": int(len(S)), "overall": stats(S), "by_age": by_age}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Evaluate a design against a synthetic persona population.")
+    ap.add_argument("--place")
+    ap.add_argument("--project", help="text file with the project description")
+    ap.add_argument("--image", help="design image (optional)")
+    ap.add_argument("--n", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--distributions", help="JSON file overriding DEFAULT_DISTRIBUTIONS")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--out", default="population_results.jsonl")
+    ap.add_argument("--summarize", metavar="RESULTS", help="only print the score summary of a results file")
+    args = ap.parse_args()
+
+    if args.summarize:
+        print(json.dumps(summarize(args.summarize), indent=2))
+        return
+    if not args.place or not args.project:
+        ap.error("--place and --project are required")
+
+    with open(args.project, "r", encoding="utf-8") as f:
+        project_description = f.read().strip()
+    image_b64 = image_to_base64(Image.open(args.image)) if args.image else None
+
+    profiles = sample_population(args.n, args.place, load_distributions(args.distributions), args.seed)
+    t0 = time.time()
+    n = evaluate_population(profiles, project_description, args.out, image_b64, args.concurrency)
+    print(f"wrote {n} results to {args.out} in {time.time() - t0:.1f}s")
+    print(json.dumps(summarize(args.out), indent=2))
+
+
+if __name__ == "__main__":
+    main()
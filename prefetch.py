@@ -0,0 +1,179 @@
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import streamlit as st
+
+from client import get_openai_client
+from rag import load_facts, _facts_checksum, built_fact_embeddings, retrieve_facts
+from geo import DEFAULT_RADIUS_M
+from feedback import request_initial_feedback
+from images import encoded_image, image_bytes, image_digest
+from metrics import trace, record, current_session_id
+from scheduler import priority, NORMAL
+from singleflight import payload_key
+
+# Speculative initial feedback: when a role is previewed on the selection page, retrieval
+# and the initial feedback call start in a worker, so "Choose this Role" usually finds the
+# answer ready. Workers get plain values only (no st.session_state access off the script thread),
+# including the OpenAI client; the script thread does no embedding or image encoding, and a
+# preview on a cold fact index (nothing embedded yet) simply doesn't prefetch.
+#
+# Budget:
+#   PREFETCH_PER_SESSION   previews kept alive per session; older ones are cancelled
+#   PREFETCH_SESSION_MAX   prefetches a session may start in total (clicking through every role)
+#   PREFETCH_MAX_INFLIGHT  process-wide cap; beyond it previews simply don't prefetch
+# A cancelled task that has not reached the API yet never calls it; one already waiting on
+# the API finishes and is discarded (its "prefetch" record has outcome "wasted").
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_PER_SESSION = int(os.getenv("PREFETCH_PER_SESSION", "2"))
+PREFETCH_SESSION_MAX = int(os.getenv("PREFETCH_SESSION_MAX", "6"))
+PREFETCH_MAX_INFLIGHT = int(os.getenv("PREFETCH_MAX_INFLIGHT", "16"))
+PREFETCH_WAIT_S = float(os.getenv("PREFETCH_WAIT_S", "60"))
+
+_inflight = 0
+_lock = threading.Lock()
+
+
+@st.cache_resource(show_spinner=False)
+def _executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+class _Task:
+    __slots__ = ("key", "future", "cancelled", "session")
+
+    def __init__(self, key, session):
+        self.key, self.session = key, session
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future.cancel():
+            _release()
+
+
+def _release():
+    global _inflight
+    with _lock:
+        _inflight -= 1
+
+
+def _key(persona_info: Dict, project_description: str, uploaded_image, location, radius_m) -> str:
+    return payload_key("prefetch", persona_info, project_description.strip(),
+                       image_digest(uploaded_image) if uploaded_image else None, location, radius_m)
+
+
+def _work(task, client, facts, fact_embs, checksum, persona_info, project_description, image_data, location, radius_m):
+    try:
+        with priority(NORMAL), trace("prefetch", session=task.session) as rec:
+            if task.cancelled.is_set():
+                rec["outcome"] = "cancelled"
+                return None
+            # process-wide image cache, keyed by content; shared with the feedback page
+            image_b64 = encoded_image(image_data) if image_data else None
+            top_facts = retrieve_facts(facts, fact_embs, persona_info, project_description, "", k=5,
+                                       location=location, radius_m=radius_m, checksum=checksum, client=client)
+            if task.cancelled.is_set():
+                rec["outcome"] = "cancelled"
+                return None
+            raw = request_initial_feedback(client, persona_info, project_description, top_facts, image_b64)
+            rec["outcome"] = "wasted" if task.cancelled.is_set() else "ready"
+            return raw, top_facts
+    finally:
+        _release()
+
+
+def _tasks() -> Dict[str, _Task]:
+    if "prefetch_tasks" not in st.session_state:
+        st.session_state.prefetch_tasks = {}
+        st.session_state.prefetch_started = 0
+    return st.session_state.prefetch_tasks
+
+
+def start_prefetch(persona_info: Dict, project_description: str, uploaded_image=None) -> bool:
+    """Start (once) the initial-feedback call for a previewed role. Returns True if a task is pending."""
+    global _inflight
+    if not (project_description or "").strip():
+        return False
+    location = st.session_state.get("project_location")
+    radius_m = st.session_state.get("project_radius_m", DEFAULT_RADIUS_M)
+    tasks = _tasks()
+    key = _key(persona_info, project_description, uploaded_image, location, radius_m)
+    if key in tasks:
+        return True
+    if PREFETCH_PER_SESSION <= 0 or st.session_state.prefetch_started >= PREFETCH_SESSION_MAX:
+        return False
+    facts = load_facts()
+    checksum = _facts_checksum(facts)
+    fact_embs = st.session_state.get("facts_embs") if st.session_state.get("facts_checksum") == checksum else None
+    if fact_embs is None:
+        fact_embs = built_fact_embeddings(checksum)
+    if fact_embs is None:
+        # cold index: embedding the corpus is the feedback page's job (with its spinner), not a preview's
+        record({"ts": time.time(), "stage": "prefetch_skip", "session": current_session_id(), "ms": 0.0,
+                "reason": "cold_index"})
+        return False
+    # resolved here: get_openai_client may call st.error, which needs the script thread
+    client = get_openai_client()
+    if not client:
+        return False
+    with _lock:
+        if _inflight >= PREFETCH_MAX_INFLIGHT:
+            return False
+        _inflight += 1
+
+    # keep only the most recent previews of this session
+    while tasks and len(tasks) >= PREFETCH_PER_SESSION:
+        tasks.pop(next(iter(tasks))).cancel()
+
+    try:
+        image_data = image_bytes(uploaded_image) if uploaded_image else None
+        task = _Task(key, current_session_id())
+        task.future = _executor().submit(_work, task, client, facts, fact_embs, checksum, persona_info,
+                                         project_description, image_data, location, radius_m)
+    except Exception:
+        # the slot is only released by _work, which never started
+        _release()
+        return False
+    tasks[key] = task
+    st.session_state.prefetch_started += 1
+    return True
+
+
+def claim_prefetch(persona_info: Dict, project_description: str, uploaded_image=None,
+                   timeout: float = PREFETCH_WAIT_S) -> Optional[str]:
+    """
+    Raw initial feedback for this role if a prefetch exists (waiting for it if still
+    running); sets last_top_facts like get_openai_response. Cancels all other prefetches.
+    """
+    tasks = _tasks()
+    key = _key(persona_info, project_description, uploaded_image,
+               st.session_state.get("project_location"), st.session_state.get("project_radius_m", DEFAULT_RADIUS_M))
+    task = tasks.pop(key, None)
+    cancel_prefetches()
+    if task is None:
+        record({"ts": time.time(), "stage": "prefetch_miss", "session": current_session_id(), "ms": 0.0})
+        return None
+    try:
+        with trace("prefetch_claim") as rec:
+            result = task.future.result(timeout=timeout)
+            rec["ready"] = result is not None
+    except Exception:
+        task.cancel()
+        return None
+    if result is None:
+        return None
+    raw, top_facts = result
+    st.session_state["last_top_facts"] = top_facts
+    return raw
+
+
+def cancel_prefetches():
+    """Cancel every pending prefetch of this session (role chosen, or page left)."""
+    tasks = _tasks()
+    for task in tasks.values():
+        task.cancel()
+    tasks.clear()
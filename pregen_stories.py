@@ -0,0 +1,82 @@
+import argparse, itertools, json, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from personas import GENDER_OPTIONS, FREQUENCY_OPTIONS, MOBILITY_OPTIONS, form_profile
+from feedback import generate_user_story, story_profile, STORY_SETTINGS
+from scheduler import priority, BACKGROUND
+from story_cache import has_story, cache_size
+
+# Pre-generate user stories for common custom-role profiles so they are served
+# from the story cache during workshops.
+#
+#   python pregen_stories.py --places "Floridsdorf,Praterstern" --workers 4
+#   python pregen_stories.py --catalogue profiles.json
+#
+# A catalogue file is a JSON list of form-shaped dicts (place, age, gender,
+# frequency_of_use, mobility_habits, reason_for_visiting, accessibility_needs, other_values).
+
+DEFAULT_PLACES = ["Floridsdorf", "Praterstern", "Karlsplatz", "Donaukanal"]
+DEFAULT_AGES = [18, 25, 35, 50, 65, 80]
+DEFAULT_GENDERS = GENDER_OPTIONS[:2]
+DEFAULT_FREQUENCIES = ["Daily", "Weekly"]
+DEFAULT_MOBILITY = [["Walking"], ["Cycling"], ["Public transit"], ["Wheelchair"]]
+
+
+def catalogue(places, ages, genders, frequencies, mobility):
+    for combo in itertools.product(places, ages, genders, frequencies, mobility):
+        yield form_profile(*combo)
+
+
+def _split(v, cast=str):
+    return [cast(x.strip()) for x in v.split(",") if x.strip()] if v else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pre-generate user stories for common custom-role profiles into the story cache.")
+    ap.add_argument("--catalogue", help="JSON list of form-shaped profiles")
+    ap.add_argument("--places")
+    ap.add_argument("--ages")
+    ap.add_argument("--genders")
+    ap.add_argument("--frequencies")
+    ap.add_argument("--mobility", help="comma separated; one profile per option")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--limit", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.catalogue:
+        with open(args.catalogue, "r", encoding="utf-8") as f:
+            profiles = json.load(f)
+    else:
+        mob = [[m] for m in _split(args.mobility)] if args.mobility else DEFAULT_MOBILITY
+        for m in mob:
+            if m[0] not in MOBILITY_OPTIONS:
+                ap.error(f"unknown mobility option {m[0]!r}")
+        freqs = _split(args.frequencies) or DEFAULT_FREQUENCIES
+        for fr in freqs:
+            if fr not in FREQUENCY_OPTIONS:
+                ap.error(f"unknown frequency option {fr!r}")
+        profiles = list(catalogue(_split(args.places) or DEFAULT_PLACES, _split(args.ages, int) or DEFAULT_AGES,
+                                  _split(args.genders) or DEFAULT_GENDERS, freqs, mob))
+
+    todo = [p for p in profiles if not has_story(story_profile(p), STORY_SETTINGS)]
+    if args.limit:
+        todo = todo[:args.limit]
+    print(f"{len(profiles)} profiles, {len(profiles) - len(todo)} already cached, generating {len(todo)}")
+
+    def work(p):
+        with priority(BACKGROUND):
+            return generate_user_story(p)
+
+    t0, failed = time.time(), 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(work, p) for p in todo]
+        for i, fut in enumerate(as_completed(futures), 1):
+            if str(fut.result()).startswith("❌"):
+                failed += 1
+            if i % 20 == 0 or i == len(futures):
+                print(f"  {i}/{len(futures)} done ({failed} failed)")
+    print(f"finished in {time.time() - t0:.1f}s; cache now holds {cache_size()} stories")
+
+
+if __name__ == "__main__":
+    main()
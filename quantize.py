@@ -0,0 +1,138 @@
+import argparse, json, os, time
+
+import numpy as np
+
+# Compact copies of the fact embedding matrix for first-pass scoring. retrieve_facts
+# ranks all candidates on the compact copy, then rescores the best RESCORE_CANDIDATES
+# exactly against the float32 rows. The compact copy is an addition, not a replacement:
+# resident memory only shrinks when the float32 matrix is a memory map (FACT_EMBS_PATH or
+# the sqlite shared cache), since rescoring then touches just the shortlisted rows'
+# pages. With an in-memory float32 matrix, quantization adds its bytes on top.
+#
+#   EMBED_QUANT=float16   2 bytes/dim
+#   EMBED_QUANT=int8      1 byte/dim + one float32 scale per row (symmetric, per row)
+#   EMBED_QUANT=dims256   first 256 dims, re-normalised, float16 (text-embedding-3
+#                         models are trained so that prefixes remain usable embeddings)
+#
+#   python quantize.py --modes float16 int8 dims256 --k 5     # memory / recall benchmark
+
+EMBED_QUANT = os.getenv("EMBED_QUANT", "")
+RESCORE_CANDIDATES = int(os.getenv("RESCORE_CANDIDATES", "50"))
+MODES = ("float16", "int8", "dims256", "dims512")
+BUILD_BLOCK = 4096
+
+
+class QuantizedMatrix:
+    """Row-normalised, compressed embedding matrix answering approximate cosine scores."""
+
+    def __init__(self, M, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"unknown EMBED_QUANT mode {mode!r}; expected one of {MODES}")
+        self.mode = mode
+        self.dims = int(mode[4:]) if mode.startswith("dims") else None
+        n, d = M.shape[0], self.dims or M.shape[1]
+        self.data = np.empty((n, d), dtype=np.int8 if mode == "int8" else np.float16)
+        self.scale = np.empty(n, dtype=np.float32) if mode == "int8" else None
+        # in row blocks, so a memory-mapped M is never copied into memory whole
+        for lo in range(0, n, BUILD_BLOCK):
+            X = np.asarray(M[lo:lo + BUILD_BLOCK, :d], dtype=np.float32)
+            X = X / (np.linalg.norm(X, axis=1, keepdims=True) + 1e-9)
+            if mode == "int8":
+                scale = (np.abs(X).max(axis=1) / 127.0 + 1e-12).astype(np.float32)
+                self.scale[lo:lo + len(X)] = scale
+                self.data[lo:lo + len(X)] = np.round(X / scale[:, None]).astype(np.int8)
+            else:
+                self.data[lo:lo + len(X)] = X.astype(np.float16)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    def cosine(self, q, rows=None) -> np.ndarray:
+        q = np.asarray(q, dtype=np.float32)
+        if self.dims:
+            q = q[:self.dims]
+        q = q / (np.linalg.norm(q) + 1e-9)
+        data = self.data if rows is None else self.data[rows]
+        if self.scale is None:
+            return data.astype(np.float32) @ q
+        scale = self.scale if rows is None else self.scale[rows]
+        return (data.astype(np.float32) @ q) * scale
+
+
+def shortlist(approx: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the n highest approximate scores (unordered)."""
+    if len(approx) <= n:
+        return np.arange(len(approx))
+    return np.argpartition(-approx, n)[:n]
+
+
+def benchmark(M, modes=MODES, k=5, n_queries=200, rescore=RESCORE_CANDIDATES, boosts=None, seed=0):
+    """
+    Memory and recall@k of each mode against exact float32 scoring (+ the same boosts).
+    Queries are fact embeddings perturbed with noise, so every query has a known neighbourhood.
+    "bytes" is the compact copy alone; "resident_bytes" adds the float32 matrix, which
+    rescoring keeps using (it drops out only when that matrix is memory-mapped).
+    """
+    rng = np.random.default_rng(seed)
+    M = np.asarray(M, dtype=np.float32)
+    Mn = M / (np.linalg.norm(M, axis=1, keepdims=True) + 1e-9)
+    boosts = np.zeros(len(M), np.float32) if boosts is None else np.asarray(boosts, np.float32)
+    picks = rng.integers(0, len(M), size=n_queries)
+    Q = M[picks] + rng.standard_normal((n_queries, M.shape[1])).astype(np.float32) * M.std() * 0.5
+    exact = [set(np.argsort(-(Mn @ (q / np.linalg.norm(q)) + boosts))[:k]) for q in Q]
+
+    out = {"facts": len(M), "dims": M.shape[1], "float32_bytes": int(M.nbytes)}
+    for mode in modes:
+        t0 = time.perf_counter()
+        QM = QuantizedMatrix(M, mode)
+        build = time.perf_counter() - t0
+        first, final, t_query = 0, 0, 0.0
+        for q, truth in zip(Q, exact):
+            t0 = time.perf_counter()
+            approx = QM.cosine(q) + boosts
+            first += len(truth & set(np.argsort(-approx)[:k]))
+            cand = shortlist(approx, max(rescore, k))
+            s = Mn[cand] @ (q / np.linalg.norm(q)) + boosts[cand]
+            top = cand[np.argsort(-s)[:k]]
+            t_query += time.perf_counter() - t0
+            final += len(truth & set(top.tolist()))
+        out[mode] = {
+            "bytes": QM.nbytes,
+            "ratio": round(M.nbytes / QM.nbytes, 2),
+            "resident_bytes": int(QM.nbytes + M.nbytes),
+            "resident_bytes_float32_mapped": QM.nbytes,
+            "recall_first_pass": round(first / (k * n_queries), 4),
+            "recall_rescored": round(final / (k * n_queries), 4),
+            "build_ms": round(build * 1000, 1),
+            "query_ms": round(t_query / n_queries * 1000, 3),
+        }
+    return out
+
+
+def main():
+    from rag import FACT_EMBS_PATH, load_facts, _facts_checksum, load_precomputed_embeddings, fact_time_index, recency_boost
+
+    ap = argparse.ArgumentParser(description="Memory / recall benchmark for quantized fact embeddings.")
+    ap.add_argument("--modes", nargs="+", default=list(MODES))
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--rescore", type=int, default=RESCORE_CANDIDATES)
+    ap.add_argument("--synthetic", type=int, metavar="N", help="use N random 1536-d rows instead of FACT_EMBS_PATH")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        M = np.random.default_rng(1).standard_normal((args.synthetic, 1536)).astype(np.float32)
+        boosts = None
+    else:
+        facts = load_facts()
+        checksum = _facts_checksum(facts)
+        M = load_precomputed_embeddings(checksum)
+        if M is None:
+            ap.error(f"no embeddings matching fact store at {FACT_EMBS_PATH}; run ingest.py --embed or use --synthetic")
+        boosts = recency_boost(fact_time_index(facts, checksum), np.arange(len(facts)))
+    print(json.dumps(benchmark(M, args.modes, args.k, args.queries, args.rescore, boosts), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,42 @@
-import json, hashlib
-from typing import Optional, Dict
+import os, re, json, hashlib
+from datetime import date
+from typing import Dict
 import numpy as np
 import streamlit as st
 from client import get_openai_client
+from metrics import trace, record_usage, payload_bytes
+from scheduler import get_scheduler, estimate_tokens
+from singleflight import get_singleflight, payload_key
+from shared_cache import cache_key, get_array, put_array, get_bytes, put_bytes
+from geo import GeoIndex, resolve_location, DEFAULT_RADIUS_M
+from quantize import QuantizedMatrix, EMBED_QUANT, RESCORE_CANDIDATES, shortlist
+
+FACTS_PATH = os.getenv("FACTS_PATH", "fact.json")
+# Optional precomputed fact embeddings written by ingest.py (raw float32 + JSON metadata)
+FACT_EMBS_PATH = os.getenv("FACT_EMBS_PATH", "fact_embeddings.f32")
+EMBED_BATCH = 512
+# Recency: score += RECENCY_WEIGHT * 0.5 ** (age / half-life); facts older than
+# MAX_AGE_YEARS (if set) are dropped before ranking. Undated facts are never dropped.
+RECENCY_WEIGHT = float(os.getenv("RECENCY_WEIGHT", "0.1"))
+RECENCY_HALF_LIFE_YEARS = float(os.getenv("RECENCY_HALF_LIFE_YEARS", "2"))
+MAX_AGE_YEARS = float(os.getenv("MAX_AGE_YEARS")) if os.getenv("MAX_AGE_YEARS") else None
+# Seconds a query embedding stays in the shared cache (every distinct question adds a row)
+QUERY_EMB_TTL = float(os.getenv("QUERY_EMB_TTL", str(7 * 24 * 3600)))
+
+def search_text(d):
+    return " ".join([
+        d.get("title",""), d.get("summary",""),
+        " ".join(d.get("tags", [])),
+        d.get("id",""), d.get("type","")
+    ])
 
 @st.cache_data(show_spinner=False)
 def load_facts():
-    with open("fact.json", "r", encoding="utf-8") as f:
+    with trace("load_facts") as rec, open(FACTS_PATH, "r", encoding="utf-8") as f:
         data = json.load(f)
+        rec["facts"] = len(data)
     for d in data:
-        d["_search_text"] = " ".join([
-            d.get("title",""), d.get("summary",""),
-            " ".join(d.get("tags", [])),
-            d.get("id",""), d.get("type","")
-        ])
+        d["_search_text"] = search_text(d)
     return data
 
 def _facts_checksum(facts):
@@ -22,14 +45,68 @@ def _facts_checksum(facts):
         h.update((d.get("id","") + d.get("title","") + d.get("summary","")).encode("utf-8"))
     return h.hexdigest()
 
+def _create_embeddings(client, stage, model, texts):
+    """client.embeddings.create, de-duplicated across sessions and run through the shared scheduler, traced."""
+    def _call():
+        with trace(stage, model=model, request_bytes=payload_bytes(texts)) as rec:
+            resp = client.embeddings.create(model=model, input=texts)
+            record_usage(rec, resp)
+        return resp
+    return get_singleflight().do(
+        payload_key("embeddings", model, texts),
+        lambda: get_scheduler().run(_call, model=model, tokens=estimate_tokens(text=texts)),
+        stage=stage,
+    )
+
+def load_precomputed_embeddings(checksum, model="text-embedding-3-small", path=None):
+    """Memory-mapped fact matrix from ingest.py if it matches this corpus and model, else None."""
+    path = path or FACT_EMBS_PATH
+    meta_path = path + ".json"
+    if not (os.path.exists(path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("checksum") != checksum or meta.get("model") != model or not meta.get("count") or not meta.get("dims"):
+        return None
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(meta["count"], meta["dims"]))
+
+def built_fact_embeddings(checksum, model="text-embedding-3-small"):
+    """Fact matrix if already embedded (ingest.py file or shared cache), else None; never calls the API."""
+    M = load_precomputed_embeddings(checksum, model)
+    if M is not None:
+        return M
+    # another worker process may already have embedded this corpus
+    return get_array("fact_embs", cache_key("fact_embs", checksum, model))
+
 @st.cache_resource(show_spinner=False)
 def embed_facts(facts, model="text-embedding-3-small", _checksum=None):
+    checksum = _checksum or _facts_checksum(facts)
+    M = built_fact_embeddings(checksum, model)
+    if M is not None:
+        return M
+    key = cache_key("fact_embs", checksum, model)
     client = get_openai_client()
     texts = [d["_search_text"] for d in facts]
-    embs = client.embeddings.create(model=model, input=texts).data
-    import numpy as _np
-    M = _np.vstack([_np.array(e.embedding, dtype=_np.float32) for e in embs])
-    return M
+    rows = []
+    for i in range(0, len(texts), EMBED_BATCH):
+        resp = _create_embeddings(client, "embed_facts", model, texts[i:i + EMBED_BATCH])
+        rows.extend(np.array(e.embedding, dtype=np.float32) for e in resp.data)
+    M = np.vstack(rows)
+    # hand back the shared memory map when there is one, so the float32 rows (read only for
+    # exact rescoring when EMBED_QUANT is set) are not also held privately by this process
+    mapped = put_array(key, M, slot=f"fact_embs:{model}")
+    return mapped if mapped is not None else M
+
+def embed_query(client, text, model="text-embedding-3-small"):
+    """Query embedding, shared across sessions and processes through the cache backend."""
+    key = cache_key("query_emb", model, text)
+    raw = get_bytes("query_emb", key)
+    if raw is not None:
+        return np.frombuffer(raw, dtype=np.float32)
+    resp = _create_embeddings(client, "query_embedding", model, text)
+    qemb = np.array(resp.data[0].embedding, dtype=np.float32)
+    put_bytes(key, qemb.tobytes(), ttl=QUERY_EMB_TTL)
+    return qemb
 
 def cosine_sim(a, B):
     a = a / (np.linalg.norm(a) + 1e-9)
@@ -44,45 +121,119 @@ def make_query_text(persona_info: Dict, project_description: str, user_message:
     ]
     return " | ".join([place, project_description, user_message] + [str(t) for t in tags if t])
 
-def _guess_area_code(place: str) -> Optional[str]:
-    if not place:
-        return None
-    p = place.lower()
-    if any(x in p for x in ["floridsdorf", "florisdorf", "1210", "21st", "21.", "xxi"]): return "FLR"
-    if "karlsplatz" in p or "karls" in p: return "KAR"
-    if "praterstern" in p or "prater" in p or "leopoldstadt" in p or "1020" in p or "2nd" in p or "2." in p: return "PRT"
-    if "donaukanal" in p: return "DNK"
-    return None
-
-def retrieve_facts(facts, fact_embs, persona_info, project_description, user_message="", k=5):
-    client = get_openai_client()
+@st.cache_resource(show_spinner=False)
+def fact_geo_index(_facts, checksum):
+    """Grid index over fact coordinates, built once per corpus."""
+    with trace("geo_index") as rec:
+        index = GeoIndex(_facts)
+        rec["cells"] = len(index.cells)
+    return index
+
+@st.cache_resource(show_spinner=False)
+def fact_quant_index(_fact_embs, checksum, mode):
+    """Compact first-pass copy of the fact matrix (see quantize.py), shared by all sessions."""
+    with trace("quant_index", mode=mode) as rec:
+        index = QuantizedMatrix(_fact_embs, mode)
+        rec["bytes"] = index.nbytes
+        # False means the float32 matrix is resident as well, on top of the compact copy
+        rec["float32_mapped"] = isinstance(_fact_embs, np.memmap)
+    return index
+
+_AS_OF_RE = re.compile(r"(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?")
+
+def parse_as_of(value) -> float:
+    """"2025", "2025-06", "2025-06-01" -> decimal year (start of the period); NaN if unparseable."""
+    m = _AS_OF_RE.match(str(value or "").strip())
+    if not m:
+        return float("nan")
+    year, month, day = int(m.group(1)), int(m.group(2) or 1), int(m.group(3) or 1)
+    return year + (min(max(month, 1), 12) - 1) / 12.0 + (min(max(day, 1), 31) - 1) / 365.0
+
+def decimal_year(d: date = None) -> float:
+    d = d or date.today()
+    return parse_as_of(d.isoformat())
+
+@st.cache_resource(show_spinner=False)
+def fact_time_index(_facts, checksum):
+    """as_of of every fact as a float64 array of decimal years (NaN when undated)."""
+    return np.array([parse_as_of((d.get("time") or {}).get("as_of")) for d in _facts], dtype=np.float64)
+
+def recency_filter(as_of, rows, max_age_years=None, since=None, now=None):
+    """Subset of `rows` inside the time window; undated facts are kept."""
+    now = decimal_year() if now is None else now
+    lo = since if since is not None else (now - max_age_years if max_age_years is not None else None)
+    if lo is None:
+        return rows
+    t = as_of[rows]
+    return rows[np.isnan(t) | (t >= lo)]
+
+def recency_boost(as_of, rows, weight=RECENCY_WEIGHT, half_life=RECENCY_HALF_LIFE_YEARS, now=None):
+    """weight * 0.5 ** (age / half_life) per row; undated facts get half the weight."""
+    if not weight:
+        return np.zeros(len(rows), dtype=np.float32)
+    now = decimal_year() if now is None else now
+    age = np.clip(now - as_of[rows], 0.0, None)
+    decay = np.where(np.isnan(age), 0.5, np.exp2(-age / max(half_life, 1e-6)))
+    return (weight * decay).astype(np.float32)
+
+def retrieve_facts(facts, fact_embs, persona_info, project_description, user_message="", k=5,
+                   location=None, radius_m=DEFAULT_RADIUS_M, geo_index=None,
+                   time_index=None, max_age_years=MAX_AGE_YEARS, since=None, now=None, quant_index=None,
+                   checksum=None, client=None):
+    """
+    Top-k facts for the query. Candidates are the facts within `radius_m` of `location`
+    (lat, lon) -- the project site, or the persona's place resolved via the gazetteer --
+    and inside the time window (`since` decimal year or `max_age_years`), topped up from
+    the whole corpus when fewer than k remain. Newer facts get a decaying recency boost.
+    With EMBED_QUANT set, candidates are ranked on a compact matrix first and only the best
+    RESCORE_CANDIDATES are rescored against the exact float32 rows.
+    Pass the corpus `checksum` (or the prebuilt indexes) so a query doesn't rehash every fact,
+    and `client` from worker threads (get_openai_client reads st.secrets and may call st.error).
+    """
+    client = client or get_openai_client()
     qtext = make_query_text(persona_info, project_description, user_message)
-    qemb = client.embeddings.create(model="text-embedding-3-small", input=qtext).data[0].embedding
-    qemb = np.array(qemb, dtype=np.float32)
+    qemb = embed_query(client, qtext)
 
-    sims = cosine_sim(qemb, fact_embs)
+    if checksum is None and (time_index is None or geo_index is None or (EMBED_QUANT and quant_index is None)):
+        checksum = _facts_checksum(facts)
+    if time_index is None:
+        time_index = fact_time_index(facts, checksum)
+    now = decimal_year() if now is None else now
 
-    place = (persona_info.get('place') or persona_info.get('Place') or "").lower()
-    boosts = []
-    for d in facts:
-        t = (d["_search_text"] + " " + d.get("summary","")).lower()
-        b = 0.0
-        if place and place in t: b += 0.15
-        if any(tag.lower() in qtext.lower() for tag in d.get("tags", [])): b += 0.1
-        boosts.append(b)
-    boosts = np.array(boosts, dtype=np.float32)
-    scores = sims + boosts
-
-    area = _guess_area_code(persona_info.get('place') or persona_info.get('Place') or "")
-    if area:
-        mask = np.array([
-            1.0 if (str(d.get("id","")).upper().startswith(f"VIE-{area}-")
-                    or area.lower() in " ".join(d.get("tags", [])).lower())
-            else 0.0
-            for d in facts
-        ], dtype=np.float32)
-        if mask.sum() > 0:
-            scores = np.where(mask > 0, scores + 0.5, -1e9)
-
-    top_idx = scores.argsort()[::-1][:k]
+    place_raw = persona_info.get('place') or persona_info.get('Place') or ""
+    if location is None:
+        location = resolve_location(place_raw)
+    cand = None
+    if location is not None:
+        index = geo_index or fact_geo_index(facts, checksum)
+        cand = index.query_radius(location[0], location[1], radius_m)
+    if cand is None or len(cand) == 0:
+        cand = np.arange(len(facts))
+    cand = recency_filter(time_index, cand, max_age_years, since, now)
+
+    quant = quant_index if quant_index is not None else (
+        fact_quant_index(fact_embs, checksum, EMBED_QUANT) if EMBED_QUANT else None)
+
+    def rank(rows, n):
+        """rows ordered by score, best n; first pass on the compact matrix when enabled."""
+        place = place_raw.lower()
+        q = qtext.lower()
+        boosts = np.zeros(len(rows), dtype=np.float32)
+        for j, i in enumerate(rows):
+            d = facts[i]
+            t = (d["_search_text"] + " " + d.get("summary","")).lower()
+            if place and place in t: boosts[j] += 0.15
+            if any(tag.lower() in q for tag in d.get("tags", [])): boosts[j] += 0.1
+        boosts += recency_boost(time_index, rows, now=now)
+        if quant is not None and len(rows) > max(RESCORE_CANDIDATES, n):
+            sel = shortlist(quant.cosine(qemb, rows) + boosts, max(RESCORE_CANDIDATES, n))
+            rows, boosts = rows[sel], boosts[sel]
+        scores = cosine_sim(qemb, np.asarray(fact_embs[rows])) + boosts
+        return rows[np.argsort(-scores, kind="stable")[:n]]
+
+    top_idx = list(rank(cand, k))
+    if len(top_idx) < k and len(cand) < len(facts):
+        rest = np.setdiff1d(np.arange(len(facts)), cand, assume_unique=True)
+        rest = recency_filter(time_index, rest, max_age_years, since, now)
+        top_idx += list(rank(rest, k - len(top_idx)))
     return [facts[i] for i in top_idx]
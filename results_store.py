@@ -0,0 +1,194 @@
+import os, json, time, hashlib, threading, fcntl
+from contextlib import contextmanager
+from typing import Dict
+
+import numpy as np
+
+# Columnar store for parsed feedback scores. Each column is its own append-only
+# binary file under RESULTS_DIR, read back as a memory map, so analytics over tens of
+# thousands of evaluations are plain vectorised NumPy (no per-row Python objects).
+#
+#   project  S16  hash of the project description
+#   variant  S16  hash of the design image ("-" when none): several designs per project
+#   persona  S48  persona name (utf-8, truncated)
+#   ts       f8   unix time
+#   scores   f4x5 Safety, Comfort, Accessibility, Aesthetics, Social Interaction
+#
+# Writers in several app processes serialise on an flock of RESULTS_DIR/.lock (the
+# threading lock only covers threads of one process).
+
+RESULTS_DIR = os.getenv("RESULTS_DIR", "results")
+
+SCORE_LABELS = ["Safety", "Comfort", "Accessibility", "Aesthetics", "Social Interaction"]
+
+COLUMNS = {
+    "project": np.dtype("S16"),
+    "variant": np.dtype("S16"),
+    "persona": np.dtype("S48"),
+    "ts": np.dtype("<f8"),
+    "scores": np.dtype(("<f4", (len(SCORE_LABELS),))),
+}
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def _write_lock(root: str):
+    with _lock, open(os.path.join(root, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _path(name: str, root: str = None) -> str:
+    return os.path.join(root or RESULTS_DIR, f"{name}.col")
+
+
+def project_id(project_description: str) -> str:
+    return hashlib.sha256((project_description or "").strip().encode("utf-8")).hexdigest()[:16]
+
+
+def _encode(s: str, width: int) -> bytes:
+    return (s or "").encode("utf-8")[:width]
+
+
+def _row_count(root: str = None) -> int:
+    """Rows fully written to every column (a torn append is ignored)."""
+    n = None
+    for name, dt in COLUMNS.items():
+        p = _path(name, root)
+        rows = os.path.getsize(p) // dt.itemsize if os.path.exists(p) else 0
+        n = rows if n is None else min(n, rows)
+    return n or 0
+
+
+def append(project: str, variant: str, persona: str, scores, ts: float = None,
+           project_description: str = None, root: str = None) -> None:
+    """Append one evaluation. `scores` is a dict keyed by SCORE_LABELS or a 5-sequence."""
+    append_many([(project, variant, persona, scores, ts)], project_description=project_description, root=root)
+
+
+def append_many(rows, project_description: str = None, root: str = None) -> int:
+    """Append (project, variant, persona, scores, ts) tuples with one write per column."""
+    if not rows:
+        return 0
+    now = time.time()
+    cols = {
+        "project": np.array([_encode(r[0], 16) for r in rows], dtype=COLUMNS["project"]),
+        "variant": np.array([_encode(r[1] or "-", 16) for r in rows], dtype=COLUMNS["variant"]),
+        "persona": np.array([_encode(r[2], 48) for r in rows], dtype=COLUMNS["persona"]),
+        "ts": np.array([r[4] or now for r in rows], dtype=COLUMNS["ts"]),
+        "scores": np.array([
+            [float(r[3].get(k, np.nan)) for k in SCORE_LABELS] if isinstance(r[3], dict) else list(r[3])
+            for r in rows
+        ], dtype="<f4").reshape(len(rows), len(SCORE_LABELS)),
+    }
+    root = root or RESULTS_DIR
+    os.makedirs(root, exist_ok=True)
+    with _write_lock(root):
+        # drop any half-written tail so columns stay aligned
+        n = _row_count(root)
+        for name, dt in COLUMNS.items():
+            p = _path(name, root)
+            if os.path.exists(p) and os.path.getsize(p) != n * dt.itemsize:
+                os.truncate(p, n * dt.itemsize)
+        for name, arr in cols.items():
+            with open(_path(name, root), "ab") as f:
+                f.write(arr.tobytes())
+        if project_description is not None:
+            _remember_project(rows[0][0], project_description, root)
+    return len(rows)
+
+
+def _remember_project(project: str, description: str, root: str):
+    p = os.path.join(root, "projects.json")
+    names = {}
+    if os.path.exists(p):
+        with open(p, "r", encoding="utf-8") as f:
+            names = json.load(f)
+    if project not in names:
+        names[project] = description.strip()[:120]
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(names, f, ensure_ascii=False)
+
+
+def project_names(root: str = None) -> Dict[str, str]:
+    p = os.path.join(root or RESULTS_DIR, "projects.json")
+    if not os.path.exists(p):
+        return {}
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load(root: str = None) -> Dict[str, np.ndarray]:
+    """All columns as read-only memory maps of equal length."""
+    n = _row_count(root)
+    out = {}
+    for name, dt in COLUMNS.items():
+        if n == 0:
+            out[name] = np.zeros(0, dtype=dt) if name != "scores" else np.zeros((0, len(SCORE_LABELS)), "<f4")
+            continue
+        if name == "scores":
+            out[name] = np.memmap(_path(name, root), dtype="<f4", mode="r", shape=(n, len(SCORE_LABELS)))
+        else:
+            out[name] = np.memmap(_path(name, root), dtype=dt, mode="r", shape=(n,))
+    return out
+
+
+def group_means(keys: np.ndarray, scores: np.ndarray):
+    """(unique keys, counts, mean scores per key) with one np.unique + bincount per score column."""
+    uniq, inv = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inv, minlength=len(uniq))
+    valid = ~np.isnan(scores)
+    sums = np.stack([np.bincount(inv, weights=np.where(valid[:, j], scores[:, j], 0.0), minlength=len(uniq))
+                     for j in range(scores.shape[1])], axis=1)
+    nums = np.stack([np.bincount(inv, weights=valid[:, j], minlength=len(uniq))
+                     for j in range(scores.shape[1])], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / nums
+    return uniq, counts, means
+
+
+def variant_deltas(cols: Dict[str, np.ndarray], project: bytes, base: bytes, other: bytes):
+    """
+    Per-persona mean score difference (other - base) for one project, only for
+    personas evaluated on both variants. Returns (personas, deltas[n, 5]).
+    """
+    sel = cols["project"] == project
+    persona, variant, scores = cols["persona"][sel], cols["variant"][sel], np.asarray(cols["scores"][sel])
+    pb, _, mb = group_means(persona[variant == base], scores[variant == base])
+    po, _, mo = group_means(persona[variant == other], scores[variant == other])
+    common, ib, io = np.intersect1d(pb, po, return_indices=True)
+    return common, mo[io] - mb[ib]
+
+
+def import_jsonl(path: str, project_description: str, variant: str = "-", root: str = None) -> int:
+    """Load population.py results into the store (one row per successful persona)."""
+    proj = project_id(project_description)
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue
+            fb = r.get("feedback")
+            if not fb:
+                continue
+            name = f"{r['profile'].get('age')}-year-old {r['profile'].get('gender', 'Person')}"
+            rows.append((proj, variant, name, fb, None))
+    return append_many(rows, project_description=project_description, root=root)
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Import population results into the columnar store.")
+    ap.add_argument("results")
+    ap.add_argument("--project", required=True, help="text file with the project description")
+    ap.add_argument("--variant", default="-")
+    args = ap.parse_args()
+    with open(args.project, "r", encoding="utf-8") as f:
+        desc = f.read().strip()
+    print(f"imported {import_jsonl(args.results, desc, args.variant)} rows")
@@ -0,0 +1,193 @@
+import os, time, threading, contextvars
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import record, current_session_id
+
+# Model routing and hedged requests for chat calls.
+#
+#   VISION_MODEL   model for requests carrying the design image (initial feedback, image follow-ups)
+#   TEXT_MODELS    comma-separated candidates for text-only follow-ups; the one with the lowest
+#                  rolling p50 wins, models without enough samples are tried first
+#   CHAT_TIMEOUT_S per-attempt client timeout
+#
+# Latency is tracked per (model, stage), so initial feedback, follow-ups and story
+# generation each get their own p50/p95. Callers report only the upstream call time
+# (Router.observe around client.chat.completions.create), never local scheduler queueing,
+# so a backed-up local queue does not look like a slow model and trigger more hedges.
+#
+# Hedging (HEDGE=0 disables): when a chat call has not finished within the rolling p95 of its
+# model and stage (or HEDGE_DEFAULT_S before enough samples exist) after it was admitted by
+# the local scheduler, an identical duplicate is sent and whichever answers first is used.
+# The hedge clock starts at admission (the attempt calls on_start right before the API
+# call), so a primary still queued behind the local rate limiter never triggers a hedge. Hedges are capped at HEDGE_MAX_FRACTION of
+# calls so a slow upstream doesn't get twice the load; the losing attempt runs to completion
+# and is discarded. Hedged calls run on a pool of HEDGE_WORKERS threads; when all are busy a
+# call runs unhedged on the caller's thread, so the pool never caps chat concurrency.
+
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4o-mini")
+TEXT_MODELS = [m.strip() for m in os.getenv("TEXT_MODELS", VISION_MODEL).split(",") if m.strip()]
+CHAT_TIMEOUT_S = float(os.getenv("CHAT_TIMEOUT_S", "60"))
+HEDGE_ENABLED = os.getenv("HEDGE", "1") not in ("0", "false", "off")
+HEDGE_DEFAULT_S = float(os.getenv("HEDGE_DEFAULT_S", "8"))
+HEDGE_MAX_FRACTION = float(os.getenv("HEDGE_MAX_FRACTION", "0.1"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "32"))
+MIN_SAMPLES = 20
+WINDOW = 200
+
+
+class LatencyTracker:
+    """Rolling window of successful upstream call latencies per (model, stage)."""
+
+    def __init__(self, window: int = WINDOW):
+        self._lock = threading.Lock()
+        self._ms = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, model: str, stage: str, ms: float):
+        with self._lock:
+            self._ms[(model, stage)].append(float(ms))
+
+    def samples(self, model: str, stage: str) -> int:
+        with self._lock:
+            return len(self._ms.get((model, stage), ()))
+
+    def percentile(self, model: str, stage: str, q: float):
+        """q-th percentile in ms, or None with fewer than MIN_SAMPLES observations."""
+        with self._lock:
+            vals = sorted(self._ms.get((model, stage), ()))
+        if len(vals) < MIN_SAMPLES:
+            return None
+        return vals[min(len(vals) - 1, int(q * len(vals)))]
+
+    def snapshot(self):
+        with self._lock:
+            keys = list(self._ms)
+        out = []
+        for model, stage in keys:
+            out.append({"model": model, "stage": stage, "samples": self.samples(model, stage),
+                        "p50_ms": self.percentile(model, stage, 0.50),
+                        "p95_ms": self.percentile(model, stage, 0.95)})
+        return out
+
+
+class Router:
+    def __init__(self, tracker: LatencyTracker = None, workers: int = HEDGE_WORKERS):
+        self.tracker = tracker or LatencyTracker()
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._busy = 0
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.unhedged_pool_full = 0
+
+    def observe(self, model: str, stage: str, ms: float):
+        """Record one successful upstream call (time spent in the API only)."""
+        self.tracker.observe(model, stage, ms)
+
+    def choose_model(self, has_image: bool, stage: str = "chat_followup") -> str:
+        """VISION_MODEL for image requests; fastest known TEXT_MODELS candidate for `stage` otherwise."""
+        if has_image or len(TEXT_MODELS) == 1:
+            return VISION_MODEL if has_image else TEXT_MODELS[0]
+        untried = [m for m in TEXT_MODELS if self.tracker.samples(m, stage) < MIN_SAMPLES]
+        if untried:
+            return min(untried, key=lambda m: self.tracker.samples(m, stage))
+        return min(TEXT_MODELS, key=lambda m: self.tracker.percentile(m, stage, 0.50))
+
+    def hedge_delay(self, model: str, stage: str) -> float:
+        p95 = self.tracker.percentile(model, stage, 0.95)
+        return p95 / 1000.0 if p95 is not None else HEDGE_DEFAULT_S
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > HEDGE_MAX_FRACTION * max(self.calls, 1):
+                return False
+            self.hedges += 1
+            return True
+
+    def _take_worker(self) -> bool:
+        with self._lock:
+            if self._busy >= self.workers:
+                return False
+            self._busy += 1
+            return True
+
+    def _submit(self, fn, started: threading.Event = None):
+        """Run fn(on_start) on the pool in a copy of the caller's context (scheduling priority)."""
+        on_start = started.set if started is not None else _noop
+
+        def run():
+            try:
+                return fn(on_start)
+            finally:
+                on_start()  # also wakes a waiter when fn failed before admission
+                with self._lock:
+                    self._busy -= 1
+        return self._pool.submit(contextvars.copy_context().run, run)
+
+    def run(self, fn, *, model: str, stage: str = "chat", hedge: bool = None):
+        """
+        Call `fn(on_start)` (one upstream attempt, calling on_start once admitted and about to
+        hit the API), hedging with a second attempt once the first has been in the API for
+        longer than the p95 of (model, stage). `fn` reports its upstream latency via observe().
+        """
+        with self._lock:
+            self.calls += 1
+        if not (HEDGE_ENABLED if hedge is None else hedge):
+            return fn(_noop)
+        if not self._take_worker():
+            with self._lock:
+                self.unhedged_pool_full += 1
+            return fn(_noop)
+
+        started = threading.Event()
+        primary = self._submit(fn, started)
+        started.wait()  # local scheduler queueing does not count toward the hedge deadline
+        delay = self.hedge_delay(model, stage)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._may_hedge():
+            return primary.result()
+        if not self._take_worker():
+            with self._lock:
+                self.hedges -= 1
+                self.unhedged_pool_full += 1
+            return primary.result()
+
+        backup = self._submit(fn)
+        record({"ts": time.time(), "stage": f"{stage}_hedge", "model": model, "session": current_session_id(),
+                "ms": round(delay * 1000, 1)})
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    if fut is backup:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return fut.result()
+                error = fut.exception()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "unhedged_pool_full": self.unhedged_pool_full, "latency": self.tracker.snapshot()}
+
+
+def _noop():
+    pass
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Router:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router()
+    return _router
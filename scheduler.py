@@ -0,0 +1,292 @@
+import os, json, time, threading, itertools
+from collections import OrderedDict, deque, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from metrics import record, current_session_id
+
+# Process-wide admission control for OpenAI calls. Every Streamlit session runs in
+# a thread of the same process, so one scheduler instance sees all of them:
+#   - token buckets per model for requests/min and tokens/min,
+#   - priority classes (interactive follow-ups before initial feedback before background work),
+#   - round-robin between sessions inside a class, so one busy session can't starve others,
+#   - queue depth / wait time exported through metrics.
+
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+
+# Conservative defaults; override with OPENAI_LIMITS='{"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}'
+DEFAULT_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200_000},
+    "gpt-4o": {"rpm": 500, "tpm": 30_000},
+    "text-embedding-3-small": {"rpm": 3000, "tpm": 1_000_000},
+}
+FALLBACK_LIMITS = {"rpm": 60, "tpm": 60_000}
+MAX_RETRIES = 3
+
+# Rough token cost of one high-detail image part
+IMAGE_TOKENS = 1105
+
+_priority = ContextVar("openai_priority", default=NORMAL)
+
+
+@contextmanager
+def priority(level: int):
+    """Set the scheduling priority for OpenAI calls made inside this block."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(messages=None, text=None, max_tokens: int = 0) -> int:
+    """Cheap prompt-size estimate (~4 chars per token) plus the completion budget."""
+    chars, images = 0, 0
+    if text is not None:
+        items = text if isinstance(text, (list, tuple)) else [text]
+        chars += sum(len(str(t)) for t in items)
+    for m in messages or []:
+        content = m.get("content", "")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images += 1
+    return chars // 4 + images * IMAGE_TOKENS + int(max_tokens or 0) + 1
+
+
+def _load_limits():
+    limits = {k: dict(v) for k, v in DEFAULT_LIMITS.items()}
+    raw = os.getenv("OPENAI_LIMITS")
+    if raw:
+        try:
+            for model, v in json.loads(raw).items():
+                limits.setdefault(model, dict(FALLBACK_LIMITS)).update(v)
+        except ValueError:
+            pass
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = float(per_minute) / 60.0
+        self.clock = clock
+        self.level = float(capacity)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float) -> float:
+        """Seconds until `n` units are available (0 if available now)."""
+        self._refill()
+        n = min(n, self.capacity)
+        if self.level >= n:
+            return 0.0
+        return (n - self.level) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, n: float):
+        self._refill()
+        self.level -= min(n, self.capacity)
+
+    def give(self, n: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + n)
+
+    def drain(self):
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class _Ticket:
+    __slots__ = ("seq", "model", "tokens", "priority", "session", "enqueued", "admitted")
+
+    def __init__(self, seq, model, tokens, priority, session, now):
+        self.seq = seq
+        self.model = model
+        self.tokens = tokens
+        self.priority = priority
+        self.session = session
+        self.enqueued = now
+        self.admitted = False
+
+
+class Scheduler:
+    def __init__(self, limits=None, clock=time.monotonic):
+        self.limits = limits if limits is not None else _load_limits()
+        self.clock = clock
+        self._cv = threading.Condition()
+        self._seq = itertools.count()
+        self._rpm = {}
+        self._tpm = {}
+        # priority -> OrderedDict(session -> deque[ticket]); dict order is the round-robin order
+        self._queues = defaultdict(OrderedDict)
+        self._waits = defaultdict(lambda: deque(maxlen=1000))
+        self.admitted = defaultdict(int)
+        self.throttled = defaultdict(int)
+
+    def _buckets(self, model):
+        if model not in self._rpm:
+            lim = self.limits.get(model, FALLBACK_LIMITS)
+            self._rpm[model] = TokenBucket(lim["rpm"], lim["rpm"], self.clock)
+            self._tpm[model] = TokenBucket(lim["tpm"], lim["tpm"], self.clock)
+        return self._rpm[model], self._tpm[model]
+
+    def _dispatch(self) -> float:
+        """Admit every ticket that can run now, in priority / round-robin order. Returns next retry delay."""
+        delay = 1.0
+        blocked = set()
+        for prio in sorted(self._queues):
+            sessions = self._queues[prio]
+            progressed = True
+            while progressed:
+                progressed = False
+                for session in list(sessions):
+                    q = sessions[session]
+                    t = q[0]
+                    if t.model in blocked:
+                        continue
+                    rpm, tpm = self._buckets(t.model)
+                    wait = max(rpm.wait_time(1), tpm.wait_time(t.tokens))
+                    if wait > 0:
+                        # keep later (lower-priority / later-session) tickets for this model from jumping ahead
+                        blocked.add(t.model)
+                        delay = min(delay, wait)
+                        continue
+                    rpm.take(1)
+                    tpm.take(t.tokens)
+                    t.admitted = True
+                    q.popleft()
+                    del sessions[session]
+                    if q:
+                        sessions[session] = q  # back of the round-robin
+                    progressed = True
+            if not sessions:
+                del self._queues[prio]
+        return delay
+
+    def acquire(self, model: str, tokens: int, prio: int = None, session: str = None) -> _Ticket:
+        prio = _priority.get() if prio is None else prio
+        session = session or current_session_id()
+        with self._cv:
+            t = _Ticket(next(self._seq), model, max(1, int(tokens)), prio, session, self.clock())
+            self._queues[prio].setdefault(session, deque()).append(t)
+            while True:
+                delay = self._dispatch()
+                if t.admitted:
+                    break
+                self._cv.notify_all()
+                self._cv.wait(timeout=delay)
+            self._cv.notify_all()
+        waited = self.clock() - t.enqueued
+        self._waits[model].append(waited)
+        self.admitted[model] += 1
+        record({"ts": time.time(), "stage": "scheduler_wait", "model": model, "session": session,
+                "priority": prio, "ms": round(waited * 1000, 3), "queue_depth": self.queue_depth()})
+        return t
+
+    def settle(self, ticket: _Ticket, actual_tokens: int):
+        """Correct the TPM bucket once the real usage is known."""
+        if not actual_tokens:
+            return
+        with self._cv:
+            _, tpm = self._buckets(ticket.model)
+            diff = ticket.tokens - int(actual_tokens)
+            if diff > 0:
+                tpm.give(diff)
+            else:
+                tpm.take(-diff)
+            self._cv.notify_all()
+
+    def throttle(self, model: str):
+        """Upstream said 429: empty the buckets so queued work backs off."""
+        with self._cv:
+            rpm, tpm = self._buckets(model)
+            rpm.drain()
+            tpm.drain()
+            self.throttled[model] += 1
+
+    def run(self, fn, *, model: str, tokens: int, prio: int = None, session: str = None):
+        """Admit, call `fn()`, settle usage; 429s are re-queued up to MAX_RETRIES times."""
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = self.acquire(model, tokens, prio, session)
+            try:
+                result = fn()
+            except Exception as e:
+                if getattr(e, "status_code", None) == 429 and attempt < MAX_RETRIES:
+                    self.throttle(model)
+                    continue
+                raise
+            usage = getattr(result, "usage", None)
+            self.settle(ticket, getattr(usage, "total_tokens", 0) if usage is not None else 0)
+            return result
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for sessions in self._queues.values() for q in sessions.values())
+
+    def stats(self):
+        rows = []
+        for model in sorted(set(self._waits) | set(self.admitted)):
+            waits = sorted(self._waits[model])
+            p = lambda q: waits[min(len(waits) - 1, int(q * len(waits)))] * 1000 if waits else 0.0
+            rows.append({"model": model, "admitted": self.admitted[model], "throttled": self.throttled[model],
+                         "wait_p50_ms": round(p(0.5), 1), "wait_p95_ms": round(p(0.95), 1)})
+        return rows
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler()
+    return _scheduler
+
+
+if __name__ == "__main__":
+    # Demo against an in-process stand-in that enforces 240 RPM the way the API does
+    # (continuous refill): 8 sessions x 33 calls; expect few or no 429s surfacing.
+    import random
+
+    class _RateLimited(Exception):
+        status_code = 429
+
+    class _StandIn:
+        def __init__(self, rpm):
+            self.bucket, self.lock, self.rejected = TokenBucket(rpm, rpm), threading.Lock(), 0
+
+        def call(self):
+            with self.lock:
+                if self.bucket.wait_time(1) > 0:
+                    self.rejected += 1
+                    raise _RateLimited()
+                self.bucket.take(1)
+            time.sleep(random.uniform(0.01, 0.05))
+            return "ok"
+
+    api = _StandIn(rpm=240)
+    sched = Scheduler(limits={"demo": {"rpm": 240, "tpm": 1_000_000}})
+    errors = []
+
+    def session(i):
+        for j in range(33):
+            try:
+                sched.run(api.call, model="demo", tokens=100, prio=INTERACTIVE if j % 5 == 0 else BACKGROUND, session=f"s{i}")
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(8)]
+    t0 = time.monotonic()
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    print(f"{len(errors)} errors, {api.rejected} upstream 429s in {time.monotonic() - t0:.1f}s", sched.stats())
@@ -0,0 +1,234 @@
+import os, time, sqlite3, threading
+from typing import Optional
+
+import numpy as np
+
+from metrics import record, current_session_id
+from singleflight import payload_key
+
+# Cache shared by every app process on a host (or, with Redis, across hosts), for results
+# that st.cache_* and st.session_state only keep per process: fact embeddings, query
+# embeddings and generated responses.
+#
+#   CACHE_BACKEND=sqlite            (default) CACHE_DIR/cache.db + CACHE_DIR/arrays/*.npy
+#   CACHE_BACKEND=redis://host:6379/0   any Redis-compatible server (needs the `redis` package)
+#   CACHE_BACKEND=none              disabled
+#
+# Keys are "<namespace>:<version>:<sha256 of the canonical JSON payload>", identical in
+# every process (never Python's salted hash()). Arrays on the local backend are .npy files
+# opened with mmap_mode="r", so every process maps the same pages instead of holding a copy;
+# on Redis they are stored as raw bytes and viewed with np.frombuffer (no decode copy).
+#
+# Growth is bounded: entries written with a ttl expire (Redis natively; sqlite rows are
+# purged by whichever process writes after CACHE_PURGE_INTERVAL_S), and arrays written to a
+# `slot` (e.g. "fact_embs:<model>") replace the slot's previous array, so a new corpus
+# checksum removes the superseded matrix. Processes still mapping the old file keep a valid
+# map until they drop it.
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+CACHE_VERSION = "v1"
+CACHE_PURGE_INTERVAL_S = float(os.getenv("CACHE_PURGE_INTERVAL_S", "600"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+
+def cache_key(namespace: str, *parts) -> str:
+    return f"{namespace}:{CACHE_VERSION}:{payload_key(*parts)}"
+
+
+class SQLiteBackend:
+    def __init__(self, root: str = None):
+        self.root = root or CACHE_DIR
+        self.path = os.path.join(self.root, "cache.db")
+        self.arrays = os.path.join(self.root, "arrays")
+        os.makedirs(self.arrays, exist_ok=True)
+        self._local = threading.local()
+        self._next_purge = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: float = None) -> None:
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, sqlite3.Binary(value), now + ttl if ttl else None))
+        if now >= self._next_purge:
+            self._next_purge = now + CACHE_PURGE_INTERVAL_S
+            self.purge(now)
+
+    def purge(self, now: float = None) -> int:
+        """Delete expired rows; returns how many."""
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?",
+                                (now or time.time(),)).rowcount
+
+    def _array_path(self, key: str) -> str:
+        return os.path.join(self.arrays, key.replace(":", "_") + ".npy")
+
+    def replace_slot(self, slot: str, key: str) -> None:
+        """Point `slot` at array `key` and delete the array it pointed at before."""
+        slot_key = f"slot:{slot}"
+        old = self.get(slot_key)
+        self.set(slot_key, key.encode("utf-8"))
+        if old is not None and old.decode("utf-8") != key:
+            try:
+                os.remove(self._array_path(old.decode("utf-8")))
+            except FileNotFoundError:
+                pass
+
+    def get_array(self, key: str) -> Optional[np.ndarray]:
+        p = self._array_path(key)
+        if not os.path.exists(p):
+            return None
+        return np.load(p, mmap_mode="r")
+
+    def set_array(self, key: str, arr: np.ndarray) -> Optional[np.ndarray]:
+        p = self._array_path(key)
+        tmp = f"{p}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(arr))
+        os.replace(tmp, p)  # atomic: readers see the old file or the complete new one
+        return np.load(p, mmap_mode="r")
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float = None) -> None:
+        self.client.set(key, value, ex=int(ttl) if ttl else None)
+
+    def get_array(self, key: str) -> Optional[np.ndarray]:
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        header, _, body = raw.partition(b"\n")
+        dtype, shape = header.decode("ascii").split("|")
+        return np.frombuffer(body, dtype=np.dtype(dtype)).reshape([int(x) for x in shape.split(",") if x])
+
+    def set_array(self, key: str, arr: np.ndarray) -> Optional[np.ndarray]:
+        arr = np.ascontiguousarray(arr)
+        header = f"{arr.dtype.str}|{','.join(str(x) for x in arr.shape)}\n".encode("ascii")
+        self.client.set(key, header + arr.tobytes())
+        return None
+
+    def replace_slot(self, slot: str, key: str) -> None:
+        old = self.client.getset(f"slot:{slot}", key)
+        if old is not None and old.decode("utf-8") != key:
+            self.client.delete(old)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_cache():
+    """The configured backend (None when disabled or unavailable)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                spec = CACHE_BACKEND.strip().lower()
+                try:
+                    if spec in ("", "none", "off"):
+                        _backend = False
+                    elif spec.startswith(("redis://", "rediss://", "unix://")):
+                        _backend = RedisBackend(CACHE_BACKEND)
+                    else:
+                        _backend = SQLiteBackend()
+                except Exception as e:
+                    record({"ts": time.time(), "stage": "shared_cache", "session": "-", "ms": 0.0,
+                            "error": f"{type(e).__name__}: {e}"})
+                    _backend = False
+    return _backend or None
+
+
+def _hit(namespace: str, hit: bool):
+    record({"ts": time.time(), "stage": f"cache_{namespace}", "session": current_session_id(), "ms": 0.0,
+            "hit": hit})
+
+
+def get_bytes(namespace: str, key: str) -> Optional[bytes]:
+    cache = get_cache()
+    if cache is None:
+        return None
+    try:
+        value = cache.get(key)
+    except Exception:
+        return None
+    _hit(namespace, value is not None)
+    return value
+
+
+def put_bytes(key: str, value: bytes, ttl: float = None) -> None:
+    cache = get_cache()
+    if cache is not None:
+        try:
+            cache.set(key, value, ttl)
+        except Exception:
+            pass
+
+
+def get_text(namespace: str, key: str) -> Optional[str]:
+    value = get_bytes(namespace, key)
+    return value.decode("utf-8") if value is not None else None
+
+
+def put_text(key: str, value: str, ttl: float = None) -> None:
+    put_bytes(key, value.encode("utf-8"), ttl)
+
+
+def get_array(namespace: str, key: str) -> Optional[np.ndarray]:
+    cache = get_cache()
+    if cache is None:
+        return None
+    try:
+        arr = cache.get_array(key)
+    except Exception:
+        return None
+    _hit(namespace, arr is not None)
+    return arr
+
+
+def put_array(key: str, arr: np.ndarray, slot: str = None) -> Optional[np.ndarray]:
+    """
+    Store `arr`; returns a memory-mapped view of the stored copy when the backend has one.
+    With `slot`, the array previously stored under the same slot is deleted.
+    """
+    cache = get_cache()
+    if cache is not None:
+        try:
+            mapped = cache.set_array(key, arr)
+            if slot:
+                cache.replace_slot(slot, key)
+            return mapped
+        except Exception:
+            pass
+    return None
@@ -0,0 +1,79 @@
+import json, hashlib, threading, time
+
+from metrics import record, current_session_id
+
+# Collapse concurrent identical upstream calls: the first caller for a key runs the
+# call, everyone else arriving while it is in flight waits for and shares its result
+# (or its exception). Nothing is cached after completion.
+
+DEFAULT_TIMEOUT = 120.0
+
+
+def payload_key(*parts) -> str:
+    """Canonical hash of a request payload (dict key order and whitespace independent)."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key: str, fn, timeout: float = DEFAULT_TIMEOUT, stage: str = "singleflight"):
+        """
+        Run `fn()` once per in-flight `key`. Followers wait up to `timeout` seconds and
+        raise TimeoutError if the leader hasn't finished; the leader's own call is not cut short.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        else:
+            t0 = time.perf_counter()
+            finished = call.done.wait(timeout)
+            record({"ts": time.time(), "stage": f"{stage}_shared", "session": current_session_id(),
+                    "ms": round((time.perf_counter() - t0) * 1000, 3),
+                    **({} if finished else {"error": "TimeoutError: waiting for in-flight call"})})
+            if not finished:
+                raise TimeoutError(f"Timed out after {timeout}s waiting for identical in-flight request")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+_group = SingleFlight()
+
+
+def get_singleflight() -> SingleFlight:
+    return _group
@@ -0,0 +1,312 @@
+import argparse, json, random, re, threading, time, uuid, zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest, error as urlerror
+
+import numpy as np
+
+from scheduler import TokenBucket, estimate_tokens
+from singleflight import payload_key
+
+# Local OpenAI-compatible stand-in for load tests and offline development.
+#
+#   python standin.py --port 8787 --chat-latency lognormal:2500,0.4 --rpm 500 --error-rate 0.01
+#   OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=sk-local streamlit run app.py
+#
+# Serves POST /v1/chat/completions and /v1/embeddings:
+#   - chat answers follow the request's json_schema response_format when there is one
+#     (so FeedbackRecord's fast path is exercised), plain text otherwise
+#   - embeddings are deterministic bag-of-words vectors, so retrieval still ranks sensibly
+#   - latency per endpoint: fixed:MS | uniform:LO,HI | lognormal:MEDIAN_MS,SIGMA | recorded
+#     plus --ms-per-token for each completion token
+#   - per-model rpm/tpm buckets answer 429 with retry-after, like the API
+#   - --error-rate injects 500s, --timeout-rate holds the request for --timeout-s
+#
+# Record / replay:
+#   --record FILE --upstream https://api.openai.com   proxy to the real API, append responses to FILE
+#   --replay FILE [--strict]                          serve recorded responses for identical payloads
+#                                                     (fall back to synthetic ones unless --strict,
+#                                                     which 404s every unrecorded payload)
+
+EMBED_DIMS = 1536
+
+
+def parse_latency(spec: str):
+    """'fixed:300' | 'uniform:200,800' | 'lognormal:600,0.5' | 'recorded' -> sampler(recorded_ms) -> seconds."""
+    kind, _, args = (spec or "fixed:0").partition(":")
+    vals = [float(x) for x in args.split(",") if x]
+    if kind == "fixed":
+        return lambda rec=None: vals[0] / 1000.0
+    if kind == "uniform":
+        return lambda rec=None: random.uniform(vals[0], vals[1]) / 1000.0
+    if kind == "lognormal":
+        median, sigma = vals[0], (vals[1] if len(vals) > 1 else 0.5)
+        return lambda rec=None: random.lognormvariate(np.log(median), sigma) / 1000.0
+    if kind == "recorded":
+        return lambda rec=None: (rec or 0.0) / 1000.0
+    raise ValueError(f"unknown latency spec {spec!r}")
+
+
+@lru_cache(maxsize=50_000)
+def _word_vector(word: str) -> np.ndarray:
+    return np.random.default_rng(zlib.crc32(word.encode("utf-8"))).standard_normal(EMBED_DIMS).astype(np.float32)
+
+
+def fake_embedding(text: str, dims: int = EMBED_DIMS) -> list:
+    words = re.findall(r"\w+", str(text).lower()) or ["empty"]
+    v = np.sum([_word_vector(w) for w in words], axis=0)[:dims]
+    return (v / (np.linalg.norm(v) + 1e-9)).tolist()
+
+
+def fake_instance(schema: dict, prompt: str = "", field: str = ""):
+    """Smallest plausible value for a JSON schema (objects, arrays, strings, numbers, enums)."""
+    if "enum" in schema:
+        return schema["enum"][0]
+    t = schema.get("type")
+    if t == "object":
+        return {k: fake_instance(v, prompt, k) for k, v in schema.get("properties", {}).items()}
+    if t == "array":
+        items = schema.get("items", {})
+        if "index" in items.get("properties", {}):
+            # batch prompts list their inputs as {"index": n, ...}: answer each one
+            n = len(re.findall(r'"index":\s*\d+', prompt)) or 1
+            return [{**fake_instance(items, prompt), "index": i} for i in range(n)]
+        return [fake_instance(items, prompt, field) for _ in range(2)]
+    if t == "integer":
+        return random.randint(1, 5)
+    if t == "number":
+        return round(random.uniform(1.0, 5.0), 1)
+    if t == "boolean":
+        return True
+    return f"Stand-in {field or 'text'}: the plaza feels open, but shade and seating matter to me."
+
+
+def _prompt_text(messages) -> str:
+    parts = []
+    for m in messages or []:
+        c = m.get("content", "")
+        parts.extend([c] if isinstance(c, str) else [p.get("text", "") for p in c if p.get("type") == "text"])
+    return "\n".join(parts)
+
+
+def fake_chat(body: dict) -> dict:
+    prompt = _prompt_text(body.get("messages"))
+    fmt = body.get("response_format") or {}
+    if fmt.get("type") == "json_schema":
+        content = json.dumps(fake_instance(fmt["json_schema"]["schema"], prompt))
+    else:
+        content = ("As someone who comes here most days, I like the new trees and benches, "
+                   "but I worry about lighting at night and space for strollers near the tram stop.")
+    prompt_tokens = estimate_tokens(body.get("messages"))
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens,
+                  "prompt_tokens_details": {"cached_tokens": 0}},
+    }
+
+
+def fake_embeddings(body: dict) -> dict:
+    inputs = body.get("input")
+    inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+    dims = int(body.get("dimensions") or EMBED_DIMS)
+    tokens = estimate_tokens(text=inputs)
+    return {
+        "object": "list", "model": body.get("model", "text-embedding-3-small"),
+        "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(t, dims)} for i, t in enumerate(inputs)],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+class StandIn:
+    """Request handling state shared by all server threads."""
+
+    def __init__(self, chat_latency="lognormal:1500,0.4", embed_latency="lognormal:120,0.3", ms_per_token=0.0,
+                 rpm=None, tpm=None, error_rate=0.0, timeout_rate=0.0, timeout_s=60.0,
+                 record=None, upstream=None, replay=None, strict=False):
+        self.chat_latency = parse_latency(chat_latency)
+        self.embed_latency = parse_latency(embed_latency)
+        self.ms_per_token = ms_per_token
+        self.rpm, self.tpm = rpm, tpm
+        self.error_rate, self.timeout_rate, self.timeout_s = error_rate, timeout_rate, timeout_s
+        self.upstream, self.strict = upstream, strict
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "rate_limited": 0, "errors": 0, "timeouts": 0, "replayed": 0, "recorded": 0}
+        self.recorded = {}
+        if replay:
+            with open(replay, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.recorded[r["key"]] = r
+        self.record_file = open(record, "a", encoding="utf-8") if record else None
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _admit(self, model: str, tokens: int) -> float:
+        """0 if admitted, else seconds until the model's buckets can take the request."""
+        if not (self.rpm or self.tpm):
+            return 0.0
+        with self.lock:
+            if model not in self.buckets:
+                self.buckets[model] = (TokenBucket(self.rpm, self.rpm) if self.rpm else None,
+                                       TokenBucket(self.tpm, self.tpm) if self.tpm else None)
+            req, tok = self.buckets[model]
+            wait = max(req.wait_time(1) if req else 0.0, tok.wait_time(tokens) if tok else 0.0)
+            if wait == 0.0:
+                if req:
+                    req.take(1)
+                if tok:
+                    tok.take(tokens)
+            return wait
+
+    def _forward(self, path: str, raw: bytes, auth: str):
+        req = urlrequest.Request(self.upstream.rstrip("/") + path, data=raw, method="POST",
+                                 headers={"Content-Type": "application/json", "Authorization": auth})
+        t0 = time.perf_counter()
+        try:
+            with urlrequest.urlopen(req, timeout=self.timeout_s) as resp:
+                status, body = resp.status, json.loads(resp.read())
+        except urlerror.HTTPError as e:
+            status, body = e.code, json.loads(e.read() or b"{}")
+        return status, body, (time.perf_counter() - t0) * 1000
+
+    def handle(self, path: str, raw: bytes, auth: str):
+        """(status, headers, body dict) for one request."""
+        self._count("requests")
+        body = json.loads(raw or b"{}")
+        key = payload_key(path, body)
+        is_chat = path.endswith("/chat/completions")
+        model = body.get("model", "")
+
+        if self.upstream:
+            status, out, ms = self._forward(path, raw, auth)
+            if self.record_file and status == 200:
+                with self.lock:
+                    self.record_file.write(json.dumps({"key": key, "path": path, "ms": round(ms, 1), "body": out}) + "\n")
+                    self.record_file.flush()
+                    self.counts["recorded"] += 1
+            return status, {}, out
+
+        tokens = estimate_tokens(body.get("messages"), max_tokens=body.get("max_tokens", 0)) if is_chat \
+            else estimate_tokens(text=body.get("input"))
+        wait = self._admit(model, tokens)
+        if wait > 0:
+            self._count("rate_limited")
+            return 429, {"retry-after": f"{wait:.2f}"}, {"error": {
+                "message": f"Rate limit reached for {model}. Please try again in {wait:.2f}s.",
+                "type": "requests", "code": "rate_limit_exceeded"}}
+
+        roll = random.random()
+        if roll < self.timeout_rate:
+            self._count("timeouts")
+            time.sleep(self.timeout_s)
+            return 504, {}, {"error": {"message": "stand-in timeout", "type": "server_error"}}
+        if roll < self.timeout_rate + self.error_rate:
+            self._count("errors")
+            return 500, {}, {"error": {"message": "stand-in injected error", "type": "server_error"}}
+
+        rec = self.recorded.get(key)
+        if rec is not None:
+            self._count("replayed")
+            out, rec_ms = rec["body"], rec.get("ms")
+        elif self.strict:
+            return 404, {}, {"error": {"message": "no recorded response for this payload", "type": "invalid_request_error"}}
+        else:
+            out, rec_ms = (fake_chat(body) if is_chat else fake_embeddings(body)), None
+
+        delay = (self.chat_latency if is_chat else self.embed_latency)(rec_ms)
+        if is_chat:
+            delay += out.get("usage", {}).get("completion_tokens", 0) * self.ms_per_token / 1000.0
+        time.sleep(delay)
+        return 200, {}, out
+
+
+def make_server(standin: StandIn, host="127.0.0.1", port=8787) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            path = self.path.split("?")[0]
+            if not path.startswith("/v1/"):
+                path = "/v1" + path
+            if path not in ("/v1/chat/completions", "/v1/embeddings"):
+                status, headers, body = 404, {}, {"error": {"message": f"unknown path {self.path}"}}
+            else:
+                try:
+                    status, headers, body = standin.handle(path, raw, self.headers.get("Authorization", ""))
+                except Exception as e:
+                    status, headers, body = 500, {}, {"error": {"message": f"{type(e).__name__}: {e}", "type": "server_error"}}
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_in_background(standin: StandIn, host="127.0.0.1", port=0):
+    """Start the stand-in on a daemon thread; returns (server, base_url)."""
+    server = make_server(standin, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_arguments(ap):
+    ap.add_argument("--chat-latency", default="lognormal:1500,0.4")
+    ap.add_argument("--embed-latency", default="lognormal:120,0.3")
+    ap.add_argument("--ms-per-token", type=float, default=0.0)
+    ap.add_argument("--rpm", type=float, help="requests/min per model (default: unlimited)")
+    ap.add_argument("--tpm", type=float, help="tokens/min per model (default: unlimited)")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--timeout-rate", type=float, default=0.0)
+    ap.add_argument("--timeout-s", type=float, default=60.0)
+    ap.add_argument("--record", metavar="FILE")
+    ap.add_argument("--upstream", help="real API base to proxy when recording, e.g. https://api.openai.com")
+    ap.add_argument("--replay", metavar="FILE")
+    ap.add_argument("--strict", action="store_true", help="404 for payloads without a recorded response")
+
+
+def standin_from_args(args) -> StandIn:
+    if args.record and not args.upstream:
+        raise SystemExit("--record needs --upstream")
+    return StandIn(args.chat_latency, args.embed_latency, args.ms_per_token, args.rpm, args.tpm,
+                   args.error_rate, args.timeout_rate, args.timeout_s,
+                   args.record, args.upstream, args.replay, args.strict)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OpenAI-compatible stand-in server.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    add_arguments(ap)
+    args = ap.parse_args()
+    standin = standin_from_args(args)
+    server = make_server(standin, args.host, args.port)
+    print(f"stand-in listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(standin.counts)
+
+
+if __name__ == "__main__":
+    main()
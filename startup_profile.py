@@ -0,0 +1,113 @@
+import argparse, json, os, re, subprocess, sys, time
+
+# Startup / import profiler.
+#
+#   python startup_profile.py                 # import time per module for app.py's imports
+#   python startup_profile.py --top 30 --render
+#
+# Imports run in a fresh interpreter with `-X importtime`, so the numbers are a cold start,
+# not whatever this process already loaded. The report lists the slowest modules (self and
+# cumulative), this repo's modules, and whether the heavy stacks (openai, numpy, PIL) were
+# loaded before the first page. --render also times a new session's first script run
+# through streamlit's AppTest, each in a fresh interpreter so the app's imports are part of
+# it (the app additionally records "first_paint" per session in metrics, see app.py).
+
+APP_IMPORTS = "import streamlit, ui_pages, metrics"
+HEAVY = ("openai", "numpy", "PIL", "pandas", "pyarrow")
+HERE = os.path.dirname(os.path.abspath(__file__))
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_times(statement: str = APP_IMPORTS, python: str = None):
+    """(rows, loaded heavy modules, wall ms) for `statement` run in a fresh interpreter."""
+    code = (f"{statement}\nimport sys, json\n"
+            f"print(json.dumps(sorted(m for m in {list(HEAVY)!r} if m in sys.modules)))")
+    t0 = time.perf_counter()
+    proc = subprocess.run([python or sys.executable, "-X", "importtime", "-c", code],
+                          cwd=HERE, capture_output=True, text=True)
+    wall = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append({"module": m.group(4), "self_ms": int(m.group(1)) / 1000,
+                         "cumulative_ms": int(m.group(2)) / 1000, "depth": len(m.group(3)) // 2})
+    heavy = json.loads(proc.stdout.strip().splitlines()[-1]) if proc.stdout.strip() else []
+    return rows, heavy, wall
+
+
+def local_modules():
+    return {os.path.splitext(f)[0] for f in os.listdir(HERE) if f.endswith(".py")}
+
+
+_RENDER = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+t0 = time.perf_counter()
+at.run()
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({"ms": ms, "error": str(at.exception[0].message) if at.exception else None}))
+"""
+
+
+def first_render_ms(script: str = "app.py", runs: int = 3, python: str = None):
+    """Median wall time of a new session's first run of `script` (AppTest, cold process per run)."""
+    times = []
+    for _ in range(runs):
+        proc = subprocess.run([python or sys.executable, "-c", _RENDER, os.path.join(HERE, script)],
+                              cwd=HERE, capture_output=True, text=True)
+        if proc.returncode != 0 or not proc.stdout.strip():
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "render failed")
+        out = json.loads(proc.stdout.strip().splitlines()[-1])
+        if out["error"]:
+            raise RuntimeError(out["error"])
+        times.append(out["ms"])
+    return sorted(times)[len(times) // 2]
+
+
+def report(statement: str = APP_IMPORTS, top: int = 20, render: bool = False):
+    rows, heavy, wall = import_times(statement)
+    ours = local_modules()
+    out = {
+        "statement": statement,
+        "interpreter_wall_ms": round(wall, 1),
+        "imports_total_ms": round(sum(r["self_ms"] for r in rows), 1),
+        "heavy_loaded_at_startup": heavy,
+        "slowest_self": sorted(rows, key=lambda r: -r["self_ms"])[:top],
+        "slowest_top_level": sorted((r for r in rows if r["depth"] == 0), key=lambda r: -r["cumulative_ms"])[:top],
+        "repo_modules": sorted((r for r in rows if r["module"] in ours), key=lambda r: -r["cumulative_ms"]),
+    }
+    if render:
+        out["first_render_ms"] = round(first_render_ms(), 1)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Report import time per module for the app's startup path.")
+    ap.add_argument("--statement", default=APP_IMPORTS, help="imports to profile (default: app.py's)")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--render", action="store_true", help="also time a fresh session's first render (AppTest)")
+    ap.add_argument("--json", action="store_true", help="print the raw report")
+    args = ap.parse_args()
+    rep = report(args.statement, args.top, args.render)
+    if args.json:
+        print(json.dumps(rep, indent=2))
+        return
+    print(f"{rep['statement']}: {rep['imports_total_ms']:.0f} ms in imports, "
+          f"{rep['interpreter_wall_ms']:.0f} ms interpreter wall")
+    print(f"heavy modules loaded at startup: {', '.join(rep['heavy_loaded_at_startup']) or 'none'}")
+    if "first_render_ms" in rep:
+        print(f"first render of a new session: {rep['first_render_ms']:.0f} ms")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  top-level module")
+    for r in rep["slowest_top_level"]:
+        print(f"{r['cumulative_ms']:>14.1f} {r['self_ms']:>9.1f}  {r['module']}")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  repo module")
+    for r in rep["repo_modules"]:
+        print(f"{r['cumulative_ms']:>14.1f} {r['self_ms']:>9.1f}  {'  ' * r['depth']}{r['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os, json, sqlite3, hashlib, threading
+from datetime import datetime
+from typing import Dict, Optional
+
+# Persistent cache of generated user stories, keyed by the normalised persona
+# profile plus the generation settings, so an identical custom role is instant.
+
+STORY_CACHE_DB = os.getenv("STORY_CACHE_DB", "stories.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    key TEXT PRIMARY KEY,
+    profile_json TEXT NOT NULL,
+    settings_json TEXT NOT NULL,
+    story TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_local = threading.local()
+
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    path = path or STORY_CACHE_DB
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        conns[path] = conn
+    return conn
+
+
+def normalize_profile(profile: Dict) -> Dict:
+    """Case/whitespace-insensitive form of the persona JSON used for the cache key."""
+    return {str(k).strip(): " ".join(str(v).split()).lower() for k, v in profile.items()}
+
+
+def story_key(profile: Dict, settings: Dict) -> str:
+    blob = json.dumps([normalize_profile(profile), settings], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def get_story(profile: Dict, settings: Dict, db: str = None) -> Optional[str]:
+    conn = _connect(db)
+    key = story_key(profile, settings)
+    row = conn.execute("SELECT story FROM stories WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    with conn:
+        conn.execute("UPDATE stories SET hits = hits + 1 WHERE key = ?", (key,))
+    return row[0]
+
+
+def put_story(profile: Dict, settings: Dict, story: str, db: str = None) -> None:
+    conn = _connect(db)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO stories (key, profile_json, settings_json, story, created_at) VALUES (?, ?, ?, ?, ?)",
+            (story_key(profile, settings), json.dumps(profile, ensure_ascii=False),
+             json.dumps(settings, sort_keys=True), story, datetime.now().isoformat(timespec="seconds")),
+        )
+
+
+def has_story(profile: Dict, settings: Dict, db: str = None) -> bool:
+    row = _connect(db).execute("SELECT 1 FROM stories WHERE key = ?", (story_key(profile, settings),)).fetchone()
+    return row is not None
+
+
+def cache_size(db: str = None) -> int:
+    return _connect(db).execute("SELECT COUNT(*) FROM stories").fetchone()[0]
@@ -0,0 +1,110 @@
+import argparse, os, sys, tempfile, time
+
+# UI smoke check: drives app.py through streamlit's AppTest against a local stand-in
+# (standin.py) and fails on any page exception.
+#
+#   python ui_check.py
+#
+# Covers the flows that only break at render/click time:
+#   prefetch  previewing a role on a cold fact index skips prefetch; once the index exists,
+#             previewing starts one and "Choose this Role" is served from it
+#   feedback  initial feedback for a predefined role, then "Export Conversation" and the
+#             download button it creates (payload must be str/bytes for st.download_button)
+
+# keep check traffic out of the real history, metrics and caches (read at import time)
+os.environ.setdefault("METRICS_PATH", "")
+_tmp = tempfile.mkdtemp(prefix="ui-check-")
+os.environ.setdefault("HISTORY_DB", os.path.join(_tmp, "history.db"))
+os.environ.setdefault("STORY_CACHE_DB", os.path.join(_tmp, "stories.db"))
+os.environ.setdefault("CACHE_DIR", os.path.join(_tmp, "cache"))
+os.environ.setdefault("RESULTS_DIR", os.path.join(_tmp, "results"))
+
+import standin
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROJECT = "Wider sidewalks, new trees and shaded seating in front of Floridsdorf station."
+
+
+def _fail(at, step):
+    if at.exception:
+        raise AssertionError(f"{step}: {at.exception[0].message}")
+
+
+def _stages(since):
+    from metrics import recent_records
+    return [r for r in recent_records() if r.get("ts", 0) >= since]
+
+
+def check_prefetch(timeout: float = 60, expect_cold: bool = False):
+    from streamlit.testing.v1 import AppTest
+    from personas import PREDEFINED_PERSONAS
+
+    t0 = time.time()
+    persona = next(iter(PREDEFINED_PERSONAS.values()))
+    at = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=timeout)
+    at.session_state["page"] = "predefined_personas"
+    at.session_state["project_description"] = PROJECT
+    at.session_state["temp_selected_persona"] = persona
+    at.run()
+    _fail(at, "role preview")
+    started = len(at.session_state["prefetch_tasks"])
+    if expect_cold:
+        if started or not any(r["stage"] == "prefetch_skip" for r in _stages(t0)):
+            raise AssertionError("prefetch: a cold index should skip prefetching")
+        return "prefetch skipped on cold index ok"
+    if started != 1:
+        raise AssertionError(f"prefetch: expected one task after the preview, got {started}")
+
+    next(b for b in at.button if b.label == "Choose this Role").click().run()
+    _fail(at, "choose role")
+    if not at.session_state["chat_history"]:
+        # the click reruns into page 'feedback'; its first run claims the prefetch
+        at.run()
+        _fail(at, "feedback after choose")
+    claims = [r for r in _stages(t0) if r["stage"] == "prefetch_claim"]
+    if not (claims and claims[-1].get("ready")):
+        raise AssertionError("prefetch: initial feedback was not served from the prefetch")
+    return "prefetch ok"
+
+
+def check_feedback_export(timeout: float = 60):
+    from streamlit.testing.v1 import AppTest
+    from personas import PREDEFINED_PERSONAS
+
+    at = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=timeout)
+    at.session_state["page"] = "feedback"
+    at.session_state["project_description"] = PROJECT
+    at.session_state["selected_persona"] = dict(next(iter(PREDEFINED_PERSONAS.values())), place="Floridsdorf")
+    at.run()
+    _fail(at, "initial feedback")
+    if not at.session_state["chat_history"]:
+        raise AssertionError("initial feedback: no chat history after the first run")
+
+    next(b for b in at.button if b.label == "Export Conversation").click().run()
+    _fail(at, "export")
+    downloads = [el for el in at.get("download_button") if "Download Conversation" in str(el.proto.label)]
+    if not downloads:
+        raise AssertionError("export: no download button rendered")
+    return "feedback export ok"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Render and click through the app against a local stand-in.")
+    ap.add_argument("--timeout", type=float, default=60)
+    args = ap.parse_args()
+
+    server, base_url = standin.serve_in_background(standin.StandIn(chat_latency="fixed:10", embed_latency="fixed:5"))
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-local")
+    try:
+        print(check_prefetch(args.timeout, expect_cold=True))
+        print(check_feedback_export(args.timeout))  # embeds the corpus into the shared cache
+        print(check_prefetch(args.timeout))
+    except AssertionError as e:
+        sys.exit(f"FAILED {e}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
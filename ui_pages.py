@@ -1,12 +1,21 @@
 import streamlit as st
-from PIL import Image
-from personas import PREDEFINED_PERSONAS, PERSONA_CATEGORIES
-from feedback import get_openai_response,generate_user_story
-from feedback import image_to_base64
-from typing import Dict
+from personas import PREDEFINED_PERSONAS, PERSONA_CATEGORIES, GENDER_OPTIONS, FREQUENCY_OPTIONS, MOBILITY_OPTIONS, persona_from_profile
+from images import thumbnail, image_digest
+from geo import DEFAULT_RADIUS_M
+from feedback_schema import FeedbackRecord, LEGACY_KEYS
+from history import (
+    start_conversation, append_message, append_messages, project_key,
+    list_conversations, count_conversations, iter_messages, iter_export,
+)
+from metrics import recent_records, load_records, summarize, current_session_id
+from scheduler import get_scheduler
+from singleflight import get_singleflight
+from routing import get_router
 import re, ast, json
 from typing import Optional, Dict
-from datetime import datetime
+
+# feedback/rag/prefetch (openai, numpy) and results_store (numpy) are imported inside the
+# pages that use them, so the upload page renders before the API and retrieval stack loads.
 
 def _extract_json_object(text: str) -> Optional[str]:
     """Pull the first balanced {...} from a string, stripping ```json fences if present."""
@@ -32,7 +41,11 @@ def _extract_json_object(text: str) -> Optional[str]:
     return None
 
 def parse_json_feedback(feedback_text: str) -> Dict:
-    """Tolerant JSON parser for the model's output; returns a dict with safe defaults."""
+    """
+    Parse the model's initial feedback into a dict with safe defaults.
+    Schema-conforming output (strict structured-output mode) takes the single fast
+    path; anything else goes through the tolerant fallback below.
+    """
     # Already a dict?
     if isinstance(feedback_text, dict):
         return feedback_text
@@ -40,6 +53,11 @@ def parse_json_feedback(feedback_text: str) -> Dict:
     if not isinstance(feedback_text, str):
         feedback_text = str(feedback_text)
 
+    try:
+        return FeedbackRecord.parse(feedback_text).to_dict()
+    except ValueError:
+        pass
+
     # normalize quotes
     cand = (_extract_json_object(feedback_text) or feedback_text).strip()
     cand = cand.replace("“", '"').replace("”", '"').replace("’", "'")
@@ -70,8 +88,14 @@ def parse_json_feedback(feedback_text: str) -> Dict:
             "Accessibility": 3.0,
             "Aesthetics": 3.0,
             "Social Interaction": 3.0,
+            "_fallback": True,
         }
 
+    # json_object mode may still use the schema's keys
+    for key, legacy in LEGACY_KEYS.items():
+        if key in data and legacy not in data:
+            data[legacy] = data.pop(key)
+
     # Ensure lists for likes/concerns
     data["What's you like"] = _normalize_points(data.get("What's you like"))
     data["What's you concern"] = _normalize_points(data.get("What's you concern"))
@@ -177,45 +201,68 @@ def display_empathy_feedback(feedback, persona_name: str = "Persona"):
 
 
 
+def _conversation_id(persona, project_description):
+    """Id of the stored conversation for the current chat, created on first use."""
+    cid = st.session_state.get("conversation_id")
+    if not cid:
+        image = st.session_state.get("uploaded_image")
+        cid = start_conversation(
+            persona, project_description,
+            project=project_key(project_description, image_digest(image) if image else ""),
+            session=current_session_id(),
+        )
+        st.session_state.conversation_id = cid
+    return cid
+
+
+def _add_message(persona, role, content):
+    """Append a chat message to the session view and (append-only) to the history store."""
+    st.session_state.chat_history.append({'role': role, 'content': content})
+    try:
+        append_message(_conversation_id(persona, st.session_state.project_description), role, content)
+    except Exception as e:
+        st.warning(f"Could not save message to history: {e}")
+
+
 def save_persona_to_history(persona, project_description, chat_history):
     """
-    Snapshot the current conversation into session state so it shows up
-    in the sidebar history (or wherever you list it later).
+    Make sure the current conversation is in the persistent history store.
+    Messages are already written as they happen; this only backfills a chat
+    that was never stored. Returns the conversation id (or None).
     """
     try:
-        # Ensure containers exist
-        if "persona_history" not in st.session_state:
-            st.session_state.persona_history = []
-        if "conversation_history" not in st.session_state:
-            st.session_state.conversation_history = {}
-
-        # Build an ID and snapshot
-        ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-        pid = f"{persona.get('name','Persona')}-{ts}"
-
-        entry = {
-            "id": pid,
-            "persona": persona,
-            "project_description": project_description or "",
-            "started_at": datetime.now().isoformat(timespec="seconds"),
-            "messages": list(chat_history) if isinstance(chat_history, list) else [],
-        }
-
-        # Lightweight list for quick display
-        st.session_state.persona_history.append({
-            "id": entry["id"],
-            "persona": entry["persona"],
-            "project_description": entry["project_description"],
-            "started_at": entry["started_at"],
-        })
-
-        # Full conversation lookup
-        st.session_state.conversation_history[pid] = entry
-
-        # (Optional) user feedback
+        cid = st.session_state.get("conversation_id")
+        if not cid:
+            cid = _conversation_id(persona, project_description)
+            append_messages(cid, list(chat_history) if isinstance(chat_history, list) else [])
         st.toast("Conversation saved to history.", icon="💾")
+        return cid
     except Exception as e:
         st.warning(f"Could not save conversation history: {e}")
+        return None
+
+
+def _record_scores(persona, parsed):
+    """Append the parsed scores of an initial feedback to the columnar results store."""
+    from results_store import append as append_result, project_id
+    if parsed.get("_fallback"):
+        return
+    image = st.session_state.get("uploaded_image")
+    try:
+        append_result(
+            project_id(st.session_state.project_description),
+            image_digest(image)[:16] if image else "-",
+            persona.get('name', 'Persona'),
+            parsed,
+            project_description=st.session_state.project_description,
+        )
+    except Exception as e:
+        st.warning(f"Could not store scores for analytics: {e}")
+
+
+def _reset_conversation():
+    st.session_state.chat_history = []
+    st.session_state.conversation_id = None
 
 
 def page_upload():
@@ -237,11 +284,18 @@ def page_upload():
         uploaded_file = st.file_uploader("Choose an image file (PNG, JPG, JPEG)", type=['png', 'jpg', 'jpeg'])
         if uploaded_file is not None:
             st.session_state.uploaded_image = uploaded_file
-            image = Image.open(uploaded_file)
-            st.image(image, caption='Your uploaded design', use_container_width=True)
+            st.image(thumbnail(uploaded_file), caption='Your uploaded design', use_container_width=True)
         elif st.session_state.uploaded_image is not None:
-            image = Image.open(st.session_state.uploaded_image)
-            st.image(image, caption='Your uploaded design', use_container_width=True)
+            st.image(thumbnail(st.session_state.uploaded_image), caption='Your uploaded design', use_container_width=True)
+    with st.expander("Project location (optional)"):
+        st.caption("Local facts are taken from around the site; without a location the role's place is used.")
+        loc = st.session_state.get("project_location") or (None, None)
+        c1, c2, c3 = st.columns(3)
+        lat = c1.number_input("Latitude", value=loc[0], min_value=-90.0, max_value=90.0, format="%.5f", placeholder="48.25660")
+        lon = c2.number_input("Longitude", value=loc[1], min_value=-180.0, max_value=180.0, format="%.5f", placeholder="16.39950")
+        radius = c3.slider("Radius (m)", 200, 5000, int(st.session_state.get("project_radius_m", DEFAULT_RADIUS_M)), step=50)
+        st.session_state.project_location = (lat, lon) if lat is not None and lon is not None else None
+        st.session_state.project_radius_m = float(radius)
     st.markdown("---")
     if st.button("Meet Your Role", type="primary", use_container_width=True):
         if project_description.strip():
@@ -278,8 +332,10 @@ def page_persona_choice():
 
 def page_predefined_personas():
     """Page 3a: Select from predefined personas"""
+    from prefetch import start_prefetch, cancel_prefetches
     st.title("Role Member Profiles")
     if st.button("← Back to Role Choice"):
+        cancel_prefetches()
         st.session_state.page = 'persona_choice'
         st.rerun()
     col1, col2 = st.columns([1, 1])
@@ -311,6 +367,8 @@ def page_predefined_personas():
                 st.markdown(f"• {value}")
             st.markdown("**User Story:**")
             st.markdown(persona['user_story'])
+            # start this role's initial feedback now so choosing it is (near-)instant
+            start_prefetch(persona, st.session_state.project_description, st.session_state.uploaded_image)
             st.markdown("---")
             if st.button("Choose this Role", type="primary", use_container_width=True):
                 st.session_state.selected_persona = persona
@@ -323,6 +381,7 @@ def page_predefined_personas():
 
 def page_custom_persona():
     """Page 3b: Create custom persona"""
+    from feedback import generate_user_story
     st.title("Create Your Custom Role")
     if st.button("← Back to Role Choice"):
         st.session_state.page = 'persona_choice'
@@ -339,13 +398,13 @@ def page_custom_persona():
             elif category == "Age":
                 persona_data[category.lower()] = st.number_input(f"{category}", min_value=18, max_value=100, value=35, help=description)
             elif category == "Gender":
-                persona_data[category.lower()] = st.selectbox(f"{category}", ["Woman", "Man", "Non-binary", "Prefer not to say", "Other"], help=description)
+                persona_data[category.lower()] = st.selectbox(f"{category}", GENDER_OPTIONS, help=description)
             elif category == "Frequency of use":
-                persona_data[category.lower().replace(' ', '_')] = st.selectbox(f"{category}", ["Daily", "Several times a week", "Weekly", "Monthly", "Occasionally", "Rarely"], help=description)
+                persona_data[category.lower().replace(' ', '_')] = st.selectbox(f"{category}", FREQUENCY_OPTIONS, help=description)
             elif category == "Reason for visiting":
                 persona_data[category.lower().replace(' ', '_')] = st.text_area(f"{category}", placeholder="e.g., walking my dog, meeting friends, commuting to work, exercising", help=description)
             elif category == "Mobility habits":
-                persona_data[category.lower().replace(' ', '_')] = st.multiselect(f"{category}", ["Walking", "Cycling", "Public transit", "Driving", "Wheelchair", "Mobility aid", "Other"], help=description)
+                persona_data[category.lower().replace(' ', '_')] = st.multiselect(f"{category}", MOBILITY_OPTIONS, help=description)
             elif category == "Accessibility needs":
                 persona_data[category.lower().replace(' ', '_')] = st.text_area(f"{category}", placeholder="e.g., wheelchair accessible paths, audio signals, good lighting, seating areas", help=description)
             elif category == "Other values":
@@ -358,21 +417,7 @@ def page_custom_persona():
                     persona_data['mobility'] = persona_data.get('mobility_habits', '')
                 with st.spinner("Generating Role story..."):
                     user_story = generate_user_story(persona_data)
-                custom_persona = {
-                    'name': f"{persona_data.get('age')}-year-old {persona_data.get('gender', 'Person')}",
-                    'age': persona_data.get('age'),
-                    'place': persona_data.get('place'),
-                    'gender': persona_data.get('gender'),
-                    'frequency': persona_data.get('frequency_of_use'),
-                    'reasons': persona_data.get('reason_for_visiting'),
-                    'mobility': persona_data.get('mobility', ''),
-                    'accessibility': persona_data.get('accessibility_needs'),
-                    'values': persona_data.get('other_values'),
-                    'story': user_story,
-                    'background': f"Regular user of {persona_data.get('place', 'the area')}, visits {persona_data.get('frequency_of_use', 'regularly')}",
-                    'concerns': ['Community well-being', 'Accessibility', 'Safety'],
-                    'tone': 'Personal and experience-based'
-                }
+                custom_persona = persona_from_profile(persona_data, user_story)
                 st.session_state.custom_persona = custom_persona
                 st.session_state.selected_persona = custom_persona
             else:
@@ -401,8 +446,54 @@ def page_custom_persona():
 
 
 
+# Number of most recent chat messages rendered by default; older ones are behind a toggle
+CHAT_WINDOW = 20
+
+
+def _render_message(persona, message):
+    if message['role'] == 'persona':
+        with st.chat_message("assistant", avatar="🙎‍♀️"):
+            st.write(f"**{persona['name']}:** {message['content']}")
+    else:
+        with st.chat_message("user", avatar="👨‍💼"):
+            st.write(f"**You:** {message['content']}")
+
+
+@st.fragment
+def _chat_area(persona):
+    """
+    Chat history + input as a fragment: submitting a question reruns only this
+    region, not the design preview and feedback blocks above it.
+    """
+    from feedback import get_openai_response
+    history = st.session_state.chat_history
+    # the first persona message is the initial JSON feedback, rendered separately
+    past = history[1:] if history and history[0]['role'] == 'persona' else history
+    if len(past) > CHAT_WINDOW and not st.toggle(f"Show all {len(past)} messages", key="show_full_chat"):
+        st.caption(f"Showing the last {CHAT_WINDOW} messages.")
+        past = past[-CHAT_WINDOW:]
+    for message in past:
+        _render_message(persona, message)
+
+    user_input = st.chat_input(f"Ask {persona['name']} a question about your project...")
+    if user_input:
+        _add_message(persona, 'user', user_input)
+        _render_message(persona, history[-1])
+        with st.spinner(f"{persona['name']} is thinking..."):
+            response = get_openai_response(
+                persona, 
+                st.session_state.project_description,
+                st.session_state.uploaded_image,
+                user_input
+            )
+        _add_message(persona, 'persona', response)
+        _render_message(persona, history[-1])
+
+
 def page_feedback():
     """Page 4: Chat with selected persona"""
+    from feedback import get_openai_response
+    from prefetch import claim_prefetch
     if not st.session_state.selected_persona:
         st.error("No persona selected. Please go back and select a persona.")
         return
@@ -418,7 +509,7 @@ def page_feedback():
 
     if st.button("← Back to Role Selection"):
         st.session_state.page = 'predefined_personas' if st.session_state.custom_persona is None else 'custom_persona'
-        st.session_state.chat_history = []
+        _reset_conversation()
         st.rerun()
 
     if not st.session_state.chat_history:
@@ -426,8 +517,7 @@ def page_feedback():
         with col1:
             st.subheader("Your Design")
             if st.session_state.uploaded_image:
-                image = Image.open(st.session_state.uploaded_image)
-                st.image(image, caption='Your urban design', use_container_width=True)
+                st.image(thumbnail(st.session_state.uploaded_image), caption='Your urban design', use_container_width=True)
             else:
                 st.info("No image uploaded")
             st.markdown("### Project Description")
@@ -440,13 +530,17 @@ def page_feedback():
         with col2:
             st.subheader(f"💬 {persona['name']}'s Feedback")
             with st.spinner(f"Getting feedback from {persona['name']}..."):
-                initial_feedback = get_openai_response(
+                initial_feedback = claim_prefetch(
+                    persona, st.session_state.project_description, st.session_state.uploaded_image
+                ) or get_openai_response(
                     persona, 
                     st.session_state.project_description,
                     st.session_state.uploaded_image
                 )
-                display_empathy_feedback(initial_feedback, persona['name'])
-                st.session_state.chat_history.append({'role': 'persona','content': initial_feedback})
+                parsed = parse_json_feedback(initial_feedback)
+                display_empathy_feedback(parsed, persona['name'])
+                _record_scores(persona, parsed)
+                _add_message(persona, 'persona', initial_feedback)
     else:
         st.markdown("---")
         st.subheader("Continue the Conversation")
@@ -464,31 +558,10 @@ def page_feedback():
             col1, col2 = st.columns([1, 2])
             with col1:
                 if st.session_state.uploaded_image:
-                    image = Image.open(st.session_state.uploaded_image)
-                    st.image(image, caption='Your design', use_container_width=True)
+                    st.image(thumbnail(st.session_state.uploaded_image, max_side=512), caption='Your design', use_container_width=True)
             with col2:
                 st.write(f"**Description:** {st.session_state.project_description}")
-        for i, message in enumerate(st.session_state.chat_history):
-            if i == 0 and message['role'] == 'persona':
-                continue
-            if message['role'] == 'persona':
-                with st.chat_message("assistant", avatar="🙎‍♀️"):
-                    st.write(f"**{persona['name']}:** {message['content']}")
-            else:
-                with st.chat_message("user", avatar="👨‍💼"):
-                    st.write(f"**You:** {message['content']}")
-    user_input = st.chat_input(f"Ask {persona['name']} a question about your project...")
-    if user_input:
-        st.session_state.chat_history.append({'role': 'user','content': user_input})
-        with st.spinner(f"{persona['name']} is thinking..."):
-            response = get_openai_response(
-                persona, 
-                st.session_state.project_description,
-                st.session_state.uploaded_image,
-                user_input
-            )
-            st.session_state.chat_history.append({'role': 'persona','content': response})
-        st.rerun()
+    _chat_area(persona)
 
     st.markdown("---")
     col1, col2, col3 = st.columns(3)
@@ -497,7 +570,7 @@ def page_feedback():
             if st.session_state.chat_history:
                 save_persona_to_history(persona, st.session_state.project_description, st.session_state.chat_history)
             st.session_state.page = 'persona_choice'
-            st.session_state.chat_history = []
+            _reset_conversation()
             st.session_state.selected_persona = None
             st.rerun()
     with col2:
@@ -505,34 +578,137 @@ def page_feedback():
             if st.session_state.chat_history:
                 save_persona_to_history(persona, st.session_state.project_description, st.session_state.chat_history)
             st.session_state.page = 'upload'
-            st.session_state.chat_history = []
+            _reset_conversation()
             st.session_state.selected_persona = None
             st.session_state.uploaded_image = None
             st.session_state.project_description = ""
             st.rerun()
     with col3:
         if st.button("Export Conversation"):
+            cid = None
             if st.session_state.chat_history:
-                save_persona_to_history(persona, st.session_state.project_description, st.session_state.chat_history)
-            conversation_text = f"Urban Design Feedback Session\n"
-            conversation_text += f"Project: {st.session_state.project_description}\n"
-            if 'occupation' in persona:
-                conversation_text += f"Community Member: {persona['name']} ({persona['occupation']})\n\n"
-            elif 'gender' in persona:
-                conversation_text += f"Community Member: {persona['name']} ({persona['age']}-year-old {persona['gender']})\n\n"
+                cid = save_persona_to_history(persona, st.session_state.project_description, st.session_state.chat_history)
+            if cid:
+                # download_button needs str/bytes and holds the payload in memory anyway
+                st.download_button(
+                    label="Download Conversation",
+                    data="".join(iter_export(cid)).encode("utf-8"),
+                    file_name=f"feedback_{persona['name'].replace(' ', '_')}.txt",
+                    mime="text/plain"
+                )
+
+
+HISTORY_PAGE_SIZE = 10
+
+
+def page_history():
+    """Saved conversations, newest first, one page at a time."""
+    st.title("Conversation History")
+    only_project = st.checkbox("Only this project", value=bool(st.session_state.project_description))
+    project = None
+    if only_project:
+        image = st.session_state.get("uploaded_image")
+        project = project_key(st.session_state.project_description, image_digest(image) if image else "")
+    total = count_conversations(project=project)
+    if not total:
+        st.info("No saved conversations yet.")
+        return
+    pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+    for conv in list_conversations(project=project, limit=HISTORY_PAGE_SIZE, offset=(page - 1) * HISTORY_PAGE_SIZE):
+        with st.expander(f"{conv['started_at']} — {conv['persona_name']} ({conv['n_messages']} messages)"):
+            st.caption(conv['project_description'][:300])
+            if st.toggle("Show messages", key=f"hist_{conv['id']}"):
+                for m in iter_messages(conv['id']):
+                    speaker = conv['persona_name'] if m['role'] == 'persona' else "You"
+                    st.markdown(f"**{speaker}:** {m['content']}")
+
+
+def page_analytics():
+    """Score analytics over every stored evaluation (vectorised over the columnar store)."""
+    import numpy as np
+    from results_store import project_id, project_names, load as load_results, group_means, variant_deltas, SCORE_LABELS
+    st.title("Score Analytics")
+    cols = load_results()
+    if not len(cols["ts"]):
+        st.info("No evaluations stored yet. Scores are recorded when a role gives initial feedback.")
+        return
+    names = project_names()
+    projects, counts = np.unique(cols["project"], return_counts=True)
+    labels = {p: f"{names.get(p.decode(), p.decode())[:60]} ({n} evaluations)" for p, n in zip(projects, counts)}
+    current = project_id(st.session_state.project_description).encode()
+    index = int(np.flatnonzero(projects == current)[0]) if current in projects else 0
+    project = st.selectbox("Project", list(projects), index=index, format_func=labels.get)
+
+    sel = cols["project"] == project
+    scores = np.asarray(cols["scores"][sel])
+    c = st.columns(len(SCORE_LABELS))
+    for j, label in enumerate(SCORE_LABELS):
+        c[j].metric(label, f"{np.nanmean(scores[:, j]):.2f}", help=f"std {np.nanstd(scores[:, j]):.2f}")
+
+    st.subheader("Per role")
+    personas, n, means = group_means(cols["persona"][sel], scores)
+    table = {"Role": [p.decode("utf-8", "ignore") for p in personas], "n": n.tolist()}
+    table.update({label: np.round(means[:, j], 2).tolist() for j, label in enumerate(SCORE_LABELS)})
+    st.dataframe(table, use_container_width=True)
+    st.bar_chart({label: dict(zip(table["Role"], table[label])) for label in SCORE_LABELS})
+
+    variants, vcounts = np.unique(cols["variant"][sel], return_counts=True)
+    if len(variants) > 1:
+        st.subheader("Design variant comparison")
+        fmt = lambda v: f"{v.decode()} ({dict(zip(variants, vcounts))[v]} evaluations)"
+        c1, c2 = st.columns(2)
+        base = c1.selectbox("Baseline design", list(variants), format_func=fmt)
+        other = c2.selectbox("Compared design", list(variants), index=1, format_func=fmt)
+        if base != other:
+            common, deltas = variant_deltas(cols, project, base, other)
+            if len(common):
+                delta_table = {"Role": [p.decode("utf-8", "ignore") for p in common]}
+                delta_table.update({label: np.round(deltas[:, j], 2).tolist() for j, label in enumerate(SCORE_LABELS)})
+                st.dataframe(delta_table, use_container_width=True)
+                st.caption("Mean score change (compared − baseline) for roles evaluated on both designs.")
             else:
-                conversation_text += f"Community Member: {persona['name']}\n\n"
-            for message in st.session_state.chat_history:
-                if message['role'] == 'persona':
-                    conversation_text += f"{persona['name']}: {message['content']}\n\n"
-                else:
-                    conversation_text += f"You: {message['content']}\n\n"
-            st.download_button(
-                label="Download Conversation",
-                data=conversation_text,
-                file_name=f"feedback_{persona['name'].replace(' ', '_')}.txt",
-                mime="text/plain"
-            )
+                st.info("No role has been evaluated on both designs yet.")
 
-# Main app routing
 
+def page_metrics():
+    """Admin: per-stage latency (p50/p95), tokens and cost."""
+    st.title("Performance Metrics")
+    scope = st.radio("Scope", ["This process", "This session", "All logged (JSONL)"], horizontal=True)
+    if scope == "This session":
+        records = recent_records(session=current_session_id())
+    elif scope == "All logged (JSONL)":
+        records = load_records()
+    else:
+        records = recent_records()
+    if not records:
+        st.info("No metrics recorded yet. Run a feedback turn first.")
+        return
+    rows = summarize(records)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Calls", sum(r["calls"] for r in rows))
+    c2.metric("Errors", sum(r["errors"] for r in rows))
+    c3.metric("Cost (USD)", f"{sum(r['cost_usd'] for r in rows):.4f}")
+    st.subheader("Per stage and model")
+    st.dataframe(rows, use_container_width=True)
+    st.subheader("Per session")
+    st.dataframe(summarize(records, by=("session", "stage")), use_container_width=True)
+    st.subheader("OpenAI scheduler")
+    sched = get_scheduler()
+    flights = get_singleflight()
+    st.caption(f"Queued requests right now: {sched.queue_depth()} · "
+               f"in flight (deduplicated): {flights.in_flight()} · calls served from a shared flight: {flights.shared}")
+    st.dataframe(sched.stats(), use_container_width=True)
+    st.subheader("Model routing")
+    routing = get_router().stats()
+    st.caption(f"Chat calls: {routing['calls']} · hedged: {routing['hedges']} · won by the hedge: {routing['hedge_wins']} · "
+               f"unhedged (hedge pool full): {routing['unhedged_pool_full']}")
+    st.dataframe(routing["latency"], use_container_width=True)
+    with st.expander("Recent errors", expanded=False):
+        errs = [r for r in records if r.get("error")][-20:]
+        for r in reversed(errs):
+            st.markdown(f"- `{r.get('stage')}` ({r.get('model') or '-'}): {r['error']}")
+        if not errs:
+            st.caption("No errors recorded.")
+
+# Main app routing